@@ -0,0 +1,117 @@
+"""
+Benchmark of decoding GAME action responses into ActionResponse, per HLP log size.
+
+Compares the full validation of every response (`strict`), the default decoding that only
+validates the action fields (`fast`), and the default decoding when the agent state is then
+used (`fast+state`, e.g. with a verbose agent or an observer reading the current task).
+
+    python benchmarks/bench_decode.py
+    python benchmarks/bench_decode.py --quick --output decode.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from virtuals_sdk.game.custom_types import ActionResponse  # noqa: E402
+
+
+def make_response(log_entries: int) -> dict:
+    log = [
+        {
+            "step": i,
+            "observation": "Observed the environment and found nothing of interest " * 2,
+            "action": {"fn_name": "function_0", "args": {"target": "apple", "amount": 3}},
+            "result": {"status": "done", "feedback": "done"},
+        }
+        for i in range(log_entries)
+    ]
+    return {
+        "action_type": "call_function",
+        "action_args": {"fn_id": "0", "fn_name": "function_0", "args": {"target": {"value": "apple"}}},
+        "agent_state": {
+            "hlp": {
+                "plan_id": "plan-0",
+                "observation_reflection": "Reflection on the observations",
+                "plan": ["step one", "step two", "step three"],
+                "plan_reasoning": "Reasoning behind the plan",
+                "current_state_of_execution": "Executing step one",
+                "change_indicator": None,
+                "log": log,
+            },
+            "current_task": {
+                "task": "Do the thing",
+                "task_reasoning": "Because it needs doing",
+                "location_id": "worker_0",
+                "llp": {
+                    "plan_id": "llp-0",
+                    "plan_reasoning": "Reasoning behind the low level plan",
+                    "situation_analysis": "Analysis of the situation",
+                    "plan": ["call function_0"],
+                    "change_indicator": None,
+                    "reflection": None,
+                },
+            },
+        },
+    }
+
+
+def measure(decode: Callable[[], object], iterations: int) -> float:
+    """Mean microseconds per decode."""
+    for _ in range(max(1, iterations // 10)):
+        decode()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        decode()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench(log_entries: int, iterations: int) -> Dict[str, float]:
+    # responses are decoded from freshly parsed JSON, as returned by the API
+    raw = json.dumps(make_response(log_entries))
+    responses = [json.loads(raw) for _ in range(16)]
+    index = [0]
+
+    def next_response() -> dict:
+        index[0] = (index[0] + 1) % len(responses)
+        return responses[index[0]]
+
+    def fast_with_state():
+        return ActionResponse.from_response(next_response()).agent_state.current_task
+
+    results = {
+        "strict_us": measure(lambda: ActionResponse.from_response(next_response(), strict=True), iterations),
+        "fast_us": measure(lambda: ActionResponse.from_response(next_response()), iterations),
+        "fast_state_us": measure(fast_with_state, iterations),
+    }
+    results["saved_us"] = results["strict_us"] - results["fast_us"]
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000, help="decodes per scenario")
+    parser.add_argument("--quick", action="store_true", help="run fewer log sizes")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    log_sizes = [0, 100] if args.quick else [0, 10, 100, 1000]
+    results = {}
+    print(f"{'scenario':<20} {'strict':>10} {'fast':>10} {'fast+state':>11} {'saved/step':>11}")
+    for log_entries in log_sizes:
+        name = f"log={log_entries}"
+        metrics = results[name] = bench(log_entries, args.iterations)
+        print(f"{name:<20} {metrics['strict_us']:>8.1f}us {metrics['fast_us']:>8.1f}us "
+              f"{metrics['fast_state_us']:>9.1f}us {metrics['saved_us']:>9.1f}us")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Benchmarks of the client-side overhead of Agent.step and Worker.step.
+
+Steps are run against the in-process GAME API stand-in (virtuals_sdk.local), so no network
+is involved: the time spent in the stand-in ("api") is measured separately and subtracted,
+leaving the time the SDK itself spends per step ("client"). Of that, the time spent building
+the request payload ("payload") and in the state functions ("state_fn") is reported separately.
+
+    python benchmarks/bench_step.py                         # full matrix
+    python benchmarks/bench_step.py --quick                 # smaller matrix
+    python benchmarks/bench_step.py --output new.json --compare baseline.json
+"""
+import argparse
+import contextlib
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from virtuals_sdk.game.agent import Agent, WorkerConfig  # noqa: E402
+from virtuals_sdk.game.custom_types import Argument, Function, FunctionResultStatus  # noqa: E402
+from virtuals_sdk.game.worker import Worker  # noqa: E402
+from virtuals_sdk.local.game_api import LocalGameAPI, LocalTransport  # noqa: E402
+
+_AGENT_STATE = {"hlp": None, "current_task": None}
+
+
+class Phases:
+    """Time spent per phase of the current step."""
+
+    def __init__(self):
+        self.elapsed: Dict[str, float] = {}
+
+    def timed(self, phase: str, fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.elapsed[phase] = self.elapsed.get(phase, 0.0) + time.perf_counter() - start
+
+        return wrapper
+
+
+class TimedTransport(LocalTransport):
+    """LocalTransport that records the time spent in the stand-in API."""
+
+    def __init__(self, api: LocalGameAPI, phases: Phases):
+        super().__init__(api)
+        self.request = phases.timed("api", self.request)
+
+
+def make_functions(count: int) -> List[Function]:
+    def executable(**kwargs):
+        return FunctionResultStatus.DONE, "done", {}
+
+    return [
+        Function(
+            fn_name=f"function_{i}",
+            fn_description=f"Benchmark function number {i} that does nothing in particular",
+            args=[
+                Argument(name="target", description="Target of the function", type="string"),
+                Argument(name="amount", description="Amount to use", type="number", optional=True),
+            ],
+            executable=executable,
+        )
+        for i in range(count)
+    ]
+
+
+def make_state_fn(state_kib: int) -> Callable:
+    # list of posts totalling roughly state_kib KiB of JSON
+    post = {"id": "0" * 16, "text": "x" * 200, "likes": 12, "tags": ["a", "b", "c"]}
+    posts = [dict(post, id=f"{i:016d}") for i in range(max(1, state_kib * 1024 // 270))]
+    state = {"balance": 100.0, "inventory": ["apple", "banana"], "recent_posts": posts}
+
+    def get_state_fn(function_result, current_state):
+        return state
+
+    return get_state_fn
+
+
+def agent_actions(worker_ids: List[str]):
+    def next_action(route, data, step):
+        if len(worker_ids) > 1 and step % 3 == 2:
+            location = worker_ids[(worker_ids.index(data["location"]) + 1) % len(worker_ids)]
+            return {"action_type": "go_to", "agent_state": _AGENT_STATE, "action_args": {"location_id": location}}
+        return {
+            "action_type": "call_function",
+            "agent_state": _AGENT_STATE,
+            "action_args": {
+                "fn_id": str(step),
+                "fn_name": data["functions"][step % len(data["functions"])]["fn_name"],
+                "args": {"target": {"value": "apple"}, "amount": {"value": 3}},
+            },
+        }
+
+    return next_action
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+def measure(step: Callable, phases: Phases, steps: int, warmup: int) -> Dict[str, float]:
+    for _ in range(warmup):
+        step()
+
+    totals, clients = [], []
+    phase_totals: Dict[str, float] = {}
+    for _ in range(steps):
+        phases.elapsed.clear()
+        start = time.perf_counter()
+        step()
+        total = time.perf_counter() - start
+        totals.append(total)
+        clients.append(total - phases.elapsed.get("api", 0.0))
+        for phase, elapsed in phases.elapsed.items():
+            phase_totals[phase] = phase_totals.get(phase, 0.0) + elapsed
+
+    # separate pass for allocations, as tracing slows every step down
+    alloc_steps = max(1, steps // 5)
+    tracemalloc.start()
+    peaks = []
+    for _ in range(alloc_steps):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        step()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+
+    results = {
+        "steps_per_sec": len(totals) / sum(totals),
+        "total_p50_ms": percentile(totals, 50) * 1000,
+        "total_p95_ms": percentile(totals, 95) * 1000,
+        "total_p99_ms": percentile(totals, 99) * 1000,
+        "client_p50_ms": percentile(clients, 50) * 1000,
+        "client_p95_ms": percentile(clients, 95) * 1000,
+        "client_p99_ms": percentile(clients, 99) * 1000,
+        "alloc_peak_kib": sum(peaks) / len(peaks) / 1024,
+    }
+    # mean time per step of the phases timed separately ("api" is the stand-in, not the SDK)
+    for phase, elapsed in sorted(phase_totals.items()):
+        results[f"{phase}_mean_ms"] = elapsed / len(totals) * 1000
+    return results
+
+
+def bench_agent(functions: int, state_kib: int, workers: int, steps: int, warmup: int,
+                verbose: bool) -> Dict[str, float]:
+    worker_ids = [f"worker_{i}" for i in range(workers)]
+    phases = Phases()
+    transport = TimedTransport(LocalGameAPI(actions=agent_actions(worker_ids)), phases)
+    state_fn = phases.timed("state_fn", make_state_fn(state_kib))
+    agent = Agent(
+        api_key="benchmark",
+        name="Benchmark",
+        agent_goal="Benchmark the SDK",
+        agent_description="Benchmark agent",
+        get_agent_state_fn=state_fn,
+        workers=[
+            WorkerConfig(id=worker_id, worker_description="Benchmark worker",
+                         get_state_fn=state_fn, action_space=make_functions(functions))
+            for worker_id in worker_ids
+        ],
+        transport=transport,
+        verbose=verbose,
+    )
+    agent.compile()
+    agent._get_action_data = phases.timed("payload", agent._get_action_data)
+    return measure(agent.step, phases, steps, warmup)
+
+
+def bench_worker(functions: int, state_kib: int, steps: int, warmup: int, verbose: bool) -> Dict[str, float]:
+    def next_action(route, data, step):
+        return agent_actions(["worker"])(route, dict(data, location="worker"), step)
+
+    phases = Phases()
+    transport = TimedTransport(LocalGameAPI(actions=next_action), phases)
+    worker = Worker(
+        api_key="benchmark",
+        description="Benchmark worker",
+        get_state_fn=phases.timed("state_fn", make_state_fn(state_kib)),
+        action_space=make_functions(functions),
+        transport=transport,
+        verbose=verbose,
+    )
+    worker.set_task("Benchmark the SDK")
+    worker._get_action_data = phases.timed("payload", worker._get_action_data)
+    return measure(worker.step, phases, steps, warmup)
+
+
+def scenarios(quick: bool):
+    function_counts = [3, 50] if quick else [3, 20, 50, 100]
+    state_sizes = [1, 64] if quick else [1, 16, 256]
+    worker_counts = [1, 8] if quick else [1, 4, 16]
+    for functions in function_counts:
+        for state_kib in state_sizes:
+            yield f"worker/functions={functions}/state={state_kib}KiB", bench_worker, dict(
+                functions=functions, state_kib=state_kib)
+            for workers in worker_counts:
+                yield f"agent/functions={functions}/state={state_kib}KiB/workers={workers}", bench_agent, dict(
+                    functions=functions, state_kib=state_kib, workers=workers)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            metric: str, threshold: float) -> bool:
+    """Print the change of `metric` against the baseline, returning whether anything regressed."""
+    regressed = False
+    print(f"\n{'scenario':<55} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name][metric], metrics[metric]
+        change = (new - old) / old if old else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{name:<55} {old:>10.3f} {new:>10.3f} {change:>+7.1%}{flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=200, help="measured steps per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured steps per scenario")
+    parser.add_argument("--quick", action="store_true", help="run a smaller matrix of scenarios")
+    parser.add_argument("--quiet", action="store_true", help="run agents and workers with verbose=False")
+    parser.add_argument("--filter", default="", help="only run scenarios containing this string (e.g. agent/)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    parser.add_argument("--metric", default="client_p50_ms", help="metric compared against the baseline")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative increase of the metric reported as a regression")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'scenario':<55} {'steps/s':>9} {'client p50':>11} {'p95':>8} {'p99':>8} "
+          f"{'payload':>8} {'api':>7} {'alloc KiB':>10}")
+    for name, bench, params in scenarios(args.quick):
+        if args.filter not in name:
+            continue
+        # the SDK prints every step - keep it out of the terminal (its cost is still measured)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            metrics = bench(steps=args.steps, warmup=args.warmup, verbose=not args.quiet, **params)
+        results[name] = metrics
+        print(f"{name:<55} {metrics['steps_per_sec']:>9.0f} {metrics['client_p50_ms']:>9.3f}ms "
+              f"{metrics['client_p95_ms']:>6.3f}ms {metrics['client_p99_ms']:>6.3f}ms "
+              f"{metrics.get('payload_mean_ms', 0.0):>6.3f}ms {metrics.get('api_mean_ms', 0.0):>5.2f}ms "
+              f"{metrics['alloc_peak_kib']:>10.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {
+                    "revision": git_revision(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "steps": args.steps,
+                    "quiet": args.quiet,
+                },
+                "results": results,
+            }, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.metric, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,72 @@
-from typing import List, Optional, Callable, Dict
+from typing import Any, Iterator, List, Optional, Callable, Dict, Set, Tuple, Union
+import threading
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from virtuals_sdk.game.worker import Worker
-from virtuals_sdk.game.custom_types import Function, FunctionResult, FunctionResultStatus, ActionResponse, ActionType
-from virtuals_sdk.game.utils import create_agent, create_workers, post
+from virtuals_sdk.game.custom_types import ActionSpace, Function, EMPTY_FUNCTION_RESULT, FunctionResult, ActionResponse, ActionType
+from virtuals_sdk.game.utils import DEFAULT_BASE_URL, DEFAULT_TOKEN_URL, GameAPIError, create_agent, create_workers, post, with_instructions
+from virtuals_sdk.game.state_diff import StateDiffEncoder
+from virtuals_sdk.game.state_budget import StateBudget
+from virtuals_sdk.game.observers import (
+    NULL_STEP_TIMER, PHASE_EXECUTE, PHASE_PAYLOAD, PHASE_STATE, PHASE_VALIDATE,
+    DurationStepTimer, StepObserver, StepTimer, build_step_info, get_observer,
+)
+from virtuals_sdk.game.checkpoint import AutoCheckpoint, read_checkpoint, write_checkpoint
+from virtuals_sdk.game.history import StepHistory
+from virtuals_sdk.game.pacing import Pacing
+from virtuals_sdk.game.provisioning import ProvisioningCache, get_provisioning_cache, provisioning_key
+from virtuals_sdk.game.retry import RetryPolicy
+from virtuals_sdk.game.worker_pool import WorkerPool, default_worker_pool
+from virtuals_sdk.transport import HTTPTransport, get_default_transport
+
+
+# a state function to run: (worker id, or None for the agent state, function, arguments)
+StateCall = Tuple[Optional[str], Callable, tuple]
+
+_state_executor: Optional[ThreadPoolExecutor] = None
+_state_executor_lock = threading.Lock()
+
+
+def get_state_executor() -> ThreadPoolExecutor:
+    """
+    Threads running the worker state functions of agents with concurrent_state_fns - shared by all
+    agents, and separate from the execution backends so they are not held up by executables
+    """
+    global _state_executor
+    if _state_executor is None:
+        with _state_executor_lock:
+            if _state_executor is None:
+                _state_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="agent-state-fn")
+    return _state_executor
 
 
 class Session:
-    def __init__(self):
+    def __init__(self, history: Optional[StepHistory] = None):
         self.id = str(uuid.uuid4())
         self.function_result: Optional[FunctionResult] = None
+        # encoders of the states sent as diffs in this session (by state field and worker)
+        self.state_encoders: Dict[str, StateDiffEncoder] = {}
+        # bounded history of the steps taken (kept across resets - records carry the session id)
+        self.history: Optional[StepHistory] = history
 
     def reset(self):
         self.id = str(uuid.uuid4())
         self.function_result = None
+        self.state_encoders = {}
+
+    def get_state_encoder(self, field: str, worker_id: Optional[str] = None) -> StateDiffEncoder:
+        key = f"{field}#{worker_id}" if worker_id is not None else field
+        encoder = self.state_encoders.get(key)
+        if encoder is None:
+            encoder = self.state_encoders[key] = StateDiffEncoder(field)
+        return encoder
+
+    def get_state_diff_stats(self) -> Dict[str, int]:
+        """Bytes of state that full states would have taken / that were actually sent in this session"""
+        return {
+            "full_bytes": sum(e.full_bytes for e in self.state_encoders.values()),
+            "sent_bytes": sum(e.sent_bytes for e in self.state_encoders.values()),
+        }
 
 
 class WorkerConfig:
@@ -29,18 +83,15 @@ class WorkerConfig:
         self.worker_description = worker_description
         self.instruction = instruction
         self.get_state_fn = get_state_fn
-        self.action_space = action_space
 
-        # setup get state function with the instructions
-        self.get_state_fn = lambda function_result, current_state: {
-            "instructions": self.instruction,  # instructions are set up in the state
-            # places the rest of the output of the get_state_fn in the state
-            **get_state_fn(function_result, current_state),
-        }
+        # setup get state function with the instructions (instructions are set up in the state)
+        self.get_state_fn = with_instructions(get_state_fn, lambda: self.instruction)
 
-        self.action_space: Dict[str, Function] = {
-            f.get_function_def()["fn_name"]: f for f in action_space
-        }
+        # function definitions are computed once and reused on every step
+        # (an ActionSpace is kept as is, so its functions can be masked through the config)
+        if not isinstance(action_space, ActionSpace):
+            action_space = ActionSpace(action_space)
+        self.action_space: ActionSpace = action_space
 
 
 class Agent:
@@ -51,17 +102,78 @@ class Agent:
                  agent_description: str,
                  get_agent_state_fn: Callable,
                  workers: Optional[List[WorkerConfig]] = None,
+                 transport: Optional[HTTPTransport] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 send_state_diffs: bool = False,
+                 base_url: Optional[str] = None,
+                 token_url: Optional[str] = None,
+                 observer: Optional[StepObserver] = None,
+                 verbose: bool = True,
+                 history_size: int = 100,
+                 history_path: Optional[str] = None,
+                 concurrent_state_fns: bool = False,
+                 worker_pool: Optional[WorkerPool] = None,
+                 provisioning_cache: Union[str, ProvisioningCache, None] = None,
+                 checkpoint_path: Optional[str] = None,
+                 checkpoint_interval: Optional[float] = None,
+                 lazy_states: bool = False,
+                 strict_responses: bool = False,
+                 state_budget: Optional[StateBudget] = None,
+                 agent_state_budget: Optional[StateBudget] = None,
                  ):
 
-        self._base_url: str = "https://game.virtuals.io"
+        # GAME API endpoints (can be overridden, e.g. to point at a local stand-in server)
+        self._base_url: str = base_url or DEFAULT_BASE_URL
+        self._token_url: str = token_url or DEFAULT_TOKEN_URL
         self._api_key: str = api_key
+        # pooled HTTP transport (shared with the workers created from this agent)
+        self._transport: HTTPTransport = transport or get_default_transport()
+        # retry policy for failed API calls (None for the default policy)
+        self._retry_policy: Optional[RetryPolicy] = retry_policy
+        # send worker and agent states as diffs against the previous step (see game.state_diff)
+        self._send_state_diffs: bool = send_state_diffs
+        # receives the actions and per-phase timings of every step (printed if verbose)
+        self._observer: Optional[StepObserver] = get_observer(observer, verbose)
+        # run the worker state function of a step concurrently with the agent state function and the
+        # next payload (they must be thread safe) - see worker_states
+        self._concurrent_state_fns: bool = concurrent_state_fns
+        self._worker_state_future: Optional[Future] = None
+        # initialize worker states on the first step in the worker, and only re-run state functions
+        # after a function call or invalidate_state (instead of on every step)
+        self._lazy_states: bool = lazy_states
+        self._agent_state_dirty: bool = False
+        self._dirty_worker_states: Set[str] = set()
+        # fully validate action responses (instead of validating the agent state on first access)
+        self._strict_responses: bool = strict_responses
+        # size budgets of the worker states and of the agent state sent to GAME (see game.state_budget)
+        self._state_budget: Optional[StateBudget] = state_budget
+        self._agent_state_budget: Optional[StateBudget] = agent_state_budget
+        # remote agents reused by the workers created with get_worker
+        self._worker_pool: WorkerPool = worker_pool if worker_pool is not None else default_worker_pool
+        # ids of agents and maps created in previous runs with the same configuration (a cache or its path)
+        self._provisioning_cache: Optional[ProvisioningCache] = get_provisioning_cache(provisioning_cache)
+        # kinds of resources ("agent", "map") whose ids come from the cache and were not used successfully yet
+        self._cached_resources: Set[str] = set()
+        # default file of checkpoint/restore, written after steps every checkpoint_interval seconds if set
+        self._checkpoint_path: Optional[str] = checkpoint_path
+        self._auto_checkpoint: Optional[AutoCheckpoint] = (
+            AutoCheckpoint(checkpoint_path, checkpoint_interval)
+            if checkpoint_path is not None and checkpoint_interval is not None else None
+        )
+        # set by restore so that run continues the restored session
+        self._resume_session: bool = False
+        # events pushed with notify, sent with the next step
+        self._pending_events: Dict[str, Any] = {}
+        self._events_lock = threading.Lock()
+        # set by notify to wake up a paced run loop
+        self._wakeup = threading.Event()
 
         # checks
         if not self._api_key:
             raise ValueError("API key not set")
 
-        # initialize session
-        self._session = Session()
+        # initialize session (with a history of the last `history_size` steps, 0 to keep none)
+        self._session = Session(StepHistory(history_size, history_path) if history_size else None)
 
         self.name = name
         self.agent_goal = agent_goal
@@ -77,38 +189,125 @@ class Agent:
         # get agent/task generator state function
         self.get_agent_state_fn = get_agent_state_fn
 
+        self.agent_state = None
+        self.agent_id = None
+        self._provision()
+
+    def _provision(self):
+        """ Set up the initial agent state and create the agent"""
         # initialize and set up agent states
         self.agent_state = self.get_agent_state_fn(None, None)
 
-        # create agent
-        self.agent_id = create_agent(
-            self._base_url, self._api_key, self.name, self.agent_description, self.agent_goal
-        )
+        # create agent (or reuse the one created with the same configuration)
+        self.agent_id = self._get_or_create_agent_id()
+
+    def _agent_key(self) -> str:
+        return provisioning_key(
+            "agent", self._api_key, self._base_url,
+            name=self.name, description=self.agent_description, goal=self.agent_goal)
+
+    def _map_key(self, workers_list: List[WorkerConfig]) -> str:
+        return provisioning_key(
+            "map", self._api_key, self._base_url,
+            locations=[[w.id, w.worker_description] for w in workers_list])
+
+    def _get_cached_id(self, kind: str, key: str) -> Optional[str]:
+        if self._provisioning_cache is None:
+            return None
+        resource_id = self._provisioning_cache.get(key)
+        if resource_id is not None:
+            self._cached_resources.add(kind)
+        return resource_id
+
+    def _get_or_create_agent_id(self) -> str:
+        """ Id of the agent - created unless the provisioning cache has one for the configuration"""
+        key = self._agent_key()
+        agent_id = self._get_cached_id("agent", key)
+        if agent_id is None:
+            agent_id = create_agent(
+                self._base_url, self._api_key, self.name, self.agent_description, self.agent_goal,
+                transport=self._transport,
+                retry_policy=self._retry_policy,
+                token_url=self._token_url,
+            )
+            if self._provisioning_cache is not None:
+                self._provisioning_cache.put(key, agent_id)
+        return agent_id
+
+    @property
+    def worker_states(self) -> Dict[str, Any]:
+        """ States of the workers - waits for the worker state function of the last step if it still runs"""
+        self._join_worker_state()
+        return self._worker_states
+
+    @worker_states.setter
+    def worker_states(self, worker_states: Dict[str, Any]):
+        self._join_worker_state()
+        self._worker_states = worker_states
+
+    def _join_worker_state(self):
+        """ Wait for the worker state function running concurrently (raising its exception, if any)"""
+        future = self._worker_state_future
+        if future is not None:
+            self._worker_state_future = None
+            future.result()
+
+    def _get_or_create_map_id(self, workers_list: List[WorkerConfig]) -> str:
+        """ Id of the map of the workers - created unless the provisioning cache has one for the configuration"""
+        key = self._map_key(workers_list)
+        map_id = self._get_cached_id("map", key)
+        if map_id is None:
+            map_id = create_workers(
+                self._base_url, self._api_key, workers_list,
+                transport=self._transport, retry_policy=self._retry_policy,
+                token_url=self._token_url)
+            if self._provisioning_cache is not None:
+                self._provisioning_cache.put(key, map_id)
+        return map_id
+
+    def _reprovision(self, error: GameAPIError):
+        """ Create again the agent or the map from the provisioning cache that the API does not know (404)"""
+        message = str(error.response_json).lower()
+        named = [kind for kind in ("agent", "map") if kind in self._cached_resources and kind in message]
+        if len(named) == 1:
+            kind = named[0]
+        else:
+            # the error does not tell which one - the map first, then the agent if the API still answers 404
+            kind = "map" if "map" in self._cached_resources else "agent"
+        self._cached_resources.discard(kind)
+        if kind == "agent":
+            self._provisioning_cache.invalidate(self._agent_key())
+            self.agent_id = self._get_or_create_agent_id()
+        else:
+            workers_list = list(self.workers.values())
+            self._provisioning_cache.invalidate(self._map_key(workers_list))
+            self._map_id = self._get_or_create_map_id(workers_list)
 
-    def compile(self):
-        """ Compile the workers for the agent - i.e. set up task generator"""
+    def _compile_workers(self) -> List[WorkerConfig]:
+        """ Workers of the map, with the agent placed at the first one and no worker state yet"""
         if not self.workers:
             raise ValueError("No workers added to the agent")
-
         workers_list = list(self.workers.values())
+        self.current_worker_id = workers_list[0].id
+        self._dirty_worker_states = set()
+        self.worker_states = {}
+        return workers_list
+
+    def _initial_state_calls(self, workers_list: List[WorkerConfig]) -> Iterator[StateCall]:
+        """ State functions initializing the worker states (none with lazy states: on first use)"""
+        if self._lazy_states:
+            return
+        for worker in workers_list:
+            yield worker.id, worker.get_state_fn, (EMPTY_FUNCTION_RESULT, self.agent_state)
 
-        self._map_id = create_workers(
-            self._base_url, self._api_key, workers_list)
-        self.current_worker_id = next(iter(self.workers.values())).id
+    def compile(self):
+        """ Compile the workers for the agent - i.e. set up task generator"""
+        workers_list = self._compile_workers()
+        self._map_id = self._get_or_create_map_id(workers_list)
 
         # initialize and set up worker states
-        worker_states = {}
-        for worker in workers_list:
-            dummy_function_result = FunctionResult(
-                action_id="",
-                action_status=FunctionResultStatus.DONE,
-                feedback_message="",
-                info={},
-            )
-            worker_states[worker.id] = worker.get_state_fn(
-                dummy_function_result, self.agent_state)
-
-        self.worker_states = worker_states
+        for worker_id, fn, args in self._initial_state_calls(workers_list):
+            self._set_state(worker_id, fn(*args))
 
         return self._map_id
 
@@ -116,6 +315,11 @@ class Agent:
         """ Reset the agent session"""
         self._session.reset()
 
+    @property
+    def history(self) -> Optional[StepHistory]:
+        """ History of the last steps taken by the agent (None if disabled)"""
+        return self._session.history
+
     def add_worker(self, worker_config: WorkerConfig):
         """Add worker to worker dict for the agent"""
         self.workers[worker_config.id] = worker_config
@@ -135,114 +339,408 @@ class Agent:
             instruction=worker_config.instruction,
             get_state_fn=worker_config.get_state_fn,
             action_space=worker_config.action_space,
+            transport=self._transport,
+            retry_policy=self._retry_policy,
+            token_url=self._token_url,
+            send_state_diffs=self._send_state_diffs,
+            base_url=self._base_url,
+            observer=self._observer,
+            verbose=False,
+            worker_pool=self._worker_pool,
+            strict_responses=self._strict_responses,
+            state_budget=self._state_budget,
+            state_budget_key=worker_id,
         )
 
-    def _get_action(
-        self,
-        function_result: Optional[FunctionResult] = None
-    ) -> ActionResponse:
+    def _get_action_data(self, function_result: Optional[FunctionResult] = None) -> dict:
+        """ Build the payload sent to GAME to get the next action"""
 
         # dummy function result if None is provided - for get_state_fn to take the same input all the time
         if function_result is None:
-            function_result = FunctionResult(
-                action_id="",
-                action_status=FunctionResultStatus.DONE,
-                feedback_message="",
-                info={},
-            )
+            function_result = EMPTY_FUNCTION_RESULT
 
         # set up payload
         data = {
             "location": self.current_worker_id,
             "map_id": self._map_id,
-            "environment": self.worker_states[self.current_worker_id],
-            "functions": [
-                f.get_function_def()
-                for f in self.workers[self.current_worker_id].action_space.values()
-            ],
-            "events": {},
+            "environment": None,
+            "functions": self.workers[self.current_worker_id].action_space.step_function_defs(),
+            "events": self._get_pending_events(),
             "agent_state": self.agent_state,
             "current_action": (
-                function_result.model_dump(
-                    exclude={'info'}) if function_result else None
+                function_result.to_wire() if function_result else None
             ),
             "version": "v2",
         }
 
+        # compact states over their budget (serialized right away unless they are diffed)
+        if self._agent_state_budget is not None:
+            data["agent_state"] = self._agent_state_budget.apply(data["agent_state"], not self._send_state_diffs)
+        # the worker state last, as the worker state function of the last step may still be running
+        data["environment"] = self.worker_states[self.current_worker_id]
+        if self._state_budget is not None:
+            data["environment"] = self._state_budget.apply(
+                data["environment"], not self._send_state_diffs, self.current_worker_id)
+
+        if self._send_state_diffs:
+            self._encode_states(data)
+
+        return data
+
+    def notify(self, event: Optional[Dict[str, Any]] = None):
+        """
+        Push an event to the agent (can be called from any thread): its items are sent in the
+        `events` of the next step, and a paced run loop waiting for its next step wakes up immediately
+        """
+        if event:
+            with self._events_lock:
+                self._pending_events.update(event)
+        self._wake()
+
+    def _wake(self):
+        self._wakeup.set()
+
+    def _get_pending_events(self) -> Dict[str, Any]:
+        if not self._pending_events:
+            return {}
+        with self._events_lock:
+            return dict(self._pending_events)
+
+    def _ack_events(self, events: Dict[str, Any]):
+        """ Forget the events that were sent (unless they were pushed again since)"""
+        if not events:
+            return
+        with self._events_lock:
+            for key, value in events.items():
+                if self._pending_events.get(key) is value:
+                    del self._pending_events[key]
+
+    def invalidate_state(self, worker_id: Optional[str] = None):
+        """
+        Re-run the state function of the agent (or of worker `worker_id`) before the next step,
+        e.g. when the environment changed without a function call
+        """
+        if worker_id is None:
+            self._agent_state_dirty = True
+        else:
+            self._dirty_worker_states.add(worker_id)
+
+    def _states_stale(self) -> bool:
+        """ Whether state functions may have to run before the step (see _refresh_state_calls)"""
+        return bool(self._lazy_states or self._agent_state_dirty or self._dirty_worker_states)
+
+    def _refresh_state_calls(self) -> Iterator[StateCall]:
+        """
+        State functions to run before the step: the invalidated ones, and the one initializing the state
+        of the current worker on first use. Each call is built once the previous one was set (_set_state).
+        """
+        if self._agent_state_dirty:
+            self._agent_state_dirty = False
+            yield None, self.get_agent_state_fn, (self._session.function_result, self.agent_state)
+        worker_id = self.current_worker_id
+        # (a worker state function still running only updates an initialized state - no need to wait for it)
+        initialized = worker_id in self._worker_states
+        if initialized and worker_id not in self._dirty_worker_states:
+            return
+        self._dirty_worker_states.discard(worker_id)
+        if initialized:
+            yield worker_id, self.workers[worker_id].get_state_fn, (
+                self._session.function_result or EMPTY_FUNCTION_RESULT, self.worker_states[worker_id])
+        else:
+            yield worker_id, self.workers[worker_id].get_state_fn, (EMPTY_FUNCTION_RESULT, self.agent_state)
+
+    def _set_state(self, worker_id: Optional[str], state: Any):
+        """ Set the state of a worker (or of the agent, for None)"""
+        if worker_id is None:
+            self.agent_state = state
+        else:
+            self.worker_states[worker_id] = state
+
+    def _refresh_states(self):
+        """ Initialize the state of the current worker if needed and re-run invalidated state functions"""
+        for worker_id, fn, args in self._refresh_state_calls():
+            self._set_state(worker_id, fn(*args))
+
+    def _update_worker_state(self, worker_id: str, function_result: FunctionResult):
+        # (not through worker_states, which waits for this function when it runs concurrently)
+        self._worker_states[worker_id] = self.workers[worker_id].get_state_fn(
+            function_result, self._worker_states[worker_id])
+
+    def _encode_states(self, data: dict):
+        """ Replace the full states in the payload by diffs against the states sent in the previous step"""
+        environment = data.pop("environment")
+        agent_state = data.pop("agent_state")
+        data.update(self._session.get_state_encoder("environment", self.current_worker_id).encode(environment))
+        data.update(self._session.get_state_encoder("agent_state").encode(agent_state))
+
+    def _build_action_data(self, function_result: Optional[FunctionResult], timer: StepTimer) -> dict:
+        start = timer.start()
+        data = self._get_action_data(function_result)
+        timer.stop(PHASE_PAYLOAD, start)
+        return data
+
+    def _reset_state_encoders(self):
+        for encoder in self._session.state_encoders.values():
+            encoder.reset()
+
+    def _resync_states(self, function_result: Optional[FunctionResult], timer: StepTimer) -> dict:
+        """ Payload with the full states (when the API could not apply the state diffs)"""
+        self._reset_state_encoders()
+        return self._build_action_data(function_result, timer)
+
+    def _get_recovery(self, error: GameAPIError, resynced: bool) -> Optional[str]:
+        """
+        How to recover from a failed request for the next action: "resync" (send the full states again),
+        "reprovision" (see _reprovision) or None (the error is raised)
+        """
+        if self._send_state_diffs and error.status_code == 409 and not resynced:
+            return "resync"
+        if error.status_code == 404 and self._cached_resources:
+            return "reprovision"
+        return None
+
+    def _decode_action(self, data: dict, response: dict, timer: StepTimer) -> ActionResponse:
+        """ Action of the response to the payload `data`"""
+        # the ids from the provisioning cache are valid
+        self._cached_resources.clear()
+        self._ack_events(data["events"])
+
+        start = timer.start()
+        action_response = ActionResponse.from_response(response, self._strict_responses)
+        timer.stop(PHASE_VALIDATE, start)
+        return action_response
+
+    def _get_action(
+        self,
+        function_result: Optional[FunctionResult] = None,
+        timer: StepTimer = NULL_STEP_TIMER,
+    ) -> ActionResponse:
+
+        data = self._build_action_data(function_result, timer)
+
         # make API call
-        response = post(
+        resynced = False
+        try:
+            while True:
+                try:
+                    response = self._post_action(data, timer)
+                    break
+                except GameAPIError as e:
+                    recovery = self._get_recovery(e, resynced)
+                    if recovery is None:
+                        raise
+                    if recovery == "resync":
+                        # state diffs could not be applied - send the full states
+                        resynced = True
+                    else:
+                        # the agent or map from the provisioning cache no longer exists - create it again
+                        self._reprovision(e)
+                data = self._resync_states(function_result, timer)
+        except BaseException:
+            # the API may not have applied the states sent - send them in full with the next step
+            self._reset_state_encoders()
+            raise
+
+        return self._decode_action(data, response, timer)
+
+    def _post_action(self, data: dict, timer: StepTimer) -> dict:
+        return post(
             base_url=self._base_url,
             api_key=self._api_key,
             endpoint=f"/v2/agents/{self.agent_id}/actions",
             data=data,
+            transport=self._transport,
+            retry_policy=self._retry_policy,
+            token_url=self._token_url,
+            timer=timer,
         )
 
-        return ActionResponse.model_validate(response)
+    def _new_step_timer(self) -> StepTimer:
+        # phases are only timed when observed - the history only records the duration of steps
+        if self._observer is not None:
+            return StepTimer()
+        if self._session.history is not None:
+            return DurationStepTimer()
+        return NULL_STEP_TIMER
+
+    def _select_function(self, action_response: ActionResponse) -> Optional[Function]:
+        """ Function to execute for the action selected by GAME (None for other actions)"""
+        if self._observer is not None:
+            self._observer.on_action(action_response)
+
+        if action_response.action_type in (ActionType.CALL_FUNCTION, ActionType.CONTINUE_FUNCTION):
+            return self._get_selected_function(action_response)
+
+        if action_response.action_type == ActionType.WAIT:
+            if self._observer is not None:
+                self._observer.on_message("Task ended completed or ended (not possible wiht current actions)")
+        elif action_response.action_type == ActionType.GO_TO:
+            self._go_to(action_response)
+        else:
+            raise ValueError(
+                f"Unknown action type: {action_response.action_type}")
+        return None
+
+    def _on_function_result(self, function_result: FunctionResult):
+        self._session.function_result = function_result
+        if self._observer is not None:
+            self._observer.on_function_result(function_result)
 
-    def step(self):
+    def _agent_state_due(self, function_result: Optional[FunctionResult]) -> bool:
+        """ Whether the agent state function runs after the step (with lazy states, only after a function call)"""
+        return function_result is not None or not self._lazy_states
 
-        # get next task/action from GAME API
-        action_response = self._get_action(self._session.function_result)
-        action_type = action_response.action_type
-
-        print("#" * 50)
-        print("STEP")
-        print(f"Current Task: {action_response.agent_state.current_task}")
-        print(f"Action response: {action_response}")
-        print(f"Action type: {action_type}")
-
-        # if new task is updated/generated
-        if (
-            action_response.agent_state.hlp
-            and action_response.agent_state.hlp.change_indicator
-        ):
-            print("New task generated")
-            print(f"Task: {action_response.agent_state.current_task}")
+    def _get_selected_function(self, action_response: ActionResponse) -> Function:
+        """ Get the function selected by GAME from the current worker's action space"""
+        if not action_response.action_args:
+            raise ValueError("No function information provided by GAME")
 
-        # execute action
-        if action_type in [
-            ActionType.CALL_FUNCTION,
-            ActionType.CONTINUE_FUNCTION,
-        ]:
-            print(f"Action Selected: {action_response.action_args['fn_name']}")
-            print(f"Action Args: {action_response.action_args['args']}")
-
-            if not action_response.action_args:
-                raise ValueError("No function information provided by GAME")
-
-            self._session.function_result = (
-                self.workers[self.current_worker_id]
-                .action_space[action_response.action_args["fn_name"]]
-                .execute(**action_response.action_args)
-            )
+        if self._observer is not None:
+            self._observer.on_message(f"Action Selected: {action_response.action_args['fn_name']}")
+            self._observer.on_message(f"Action Args: {action_response.action_args['args']}")
 
-            print(f"Function result: {self._session.function_result}")
+        return (
+            self.workers[self.current_worker_id]
+            .action_space.get_function(action_response.action_args["fn_name"])
+        )
 
-            # update worker states
-            updated_worker_state = self.workers[self.current_worker_id].get_state_fn(
-                self._session.function_result, self.worker_states[self.current_worker_id])
-            self.worker_states[self.current_worker_id] = updated_worker_state
+    def _go_to(self, action_response: ActionResponse):
+        """ Move to the worker selected by GAME"""
+        if not action_response.action_args:
+            raise ValueError("No location information provided by GAME")
+
+        next_worker = action_response.action_args["location_id"]
+        if self._observer is not None:
+            self._observer.on_message(f"Next worker selected: {next_worker}")
+        self.current_worker_id = next_worker
+
+    def _get_checkpoint_path(self, path: Optional[str]) -> str:
+        path = path or self._checkpoint_path
+        if path is None:
+            raise ValueError("No checkpoint path")
+        return path
+
+    def _checkpoint_data(self) -> Dict[str, Any]:
+        function_result = self._session.function_result
+        return {
+            "kind": "agent",
+            "agent_id": self.agent_id,
+            "current_worker_id": self.current_worker_id,
+            "agent_state": self.agent_state,
+            "worker_states": self.worker_states,
+            "session_id": self._session.id,
+            "function_result": function_result.model_dump(mode="json") if function_result is not None else None,
+            "events": self._get_pending_events(),
+        }
 
-        elif action_response.action_type == ActionType.WAIT:
-            print("Task ended completed or ended (not possible wiht current actions)")
+    def checkpoint(self, path: Optional[str] = None):
+        """ Save the session of the agent (location, states, last function result and pending events) to `path`"""
+        write_checkpoint(self._get_checkpoint_path(path), self._checkpoint_data())
+
+    def restore(self, path: Optional[str] = None) -> bool:
+        """
+        Resume the session saved by `checkpoint` (after compile) - `run` then continues it instead of
+        starting a new session. Returns False if there is no checkpoint at `path`.
+        """
+        data = read_checkpoint(self._get_checkpoint_path(path), "agent")
+        if data is None:
+            return False
+        if data["current_worker_id"] not in self.workers:
+            raise ValueError(f"Unknown worker in checkpoint: {data['current_worker_id']}")
+
+        # the map is the one of the current workers (compiled), the agent the one of the session
+        self.agent_id = data["agent_id"]
+        self.current_worker_id = data["current_worker_id"]
+        self.agent_state = data["agent_state"]
+        self.worker_states.update(
+            {worker_id: state for worker_id, state in data["worker_states"].items() if worker_id in self.workers})
 
-        elif action_response.action_type == ActionType.GO_TO:
-            if not action_response.action_args:
-                raise ValueError("No location information provided by GAME")
+        self._session.reset()
+        self._session.id = data["session_id"]
+        if data["function_result"] is not None:
+            self._session.function_result = FunctionResult.model_validate(data["function_result"])
+        if data["events"]:
+            with self._events_lock:
+                self._pending_events = {**data["events"], **self._pending_events}
+        self._resume_session = True
+        return True
+
+    def _record_step(self, action_response: ActionResponse, timer: StepTimer, location: Optional[str],
+                     function_result: Optional[FunctionResult]):
+        """ Add the step to the history and pass it to the observer"""
+        if self._observer is None and self._session.history is None:
+            return
+        # the history does not keep the current task: the agent state is only parsed for observers
+        info = build_step_info(action_response, timer, function_result, parse_state=self._observer is not None,
+                               agent_id=self.agent_id, location=location)
+        if self._session.history is not None:
+            self._session.history.append(info, self._session.id)
+        if self._observer is not None:
+            self._observer.on_step(info)
+
+    def _end_step(self, action_response: ActionResponse, timer: StepTimer, location: Optional[str],
+                  function_result: Optional[FunctionResult]) -> bool:
+        """ Record the step - returns whether a checkpoint is due"""
+        self._record_step(action_response, timer, location, function_result)
+        return self._auto_checkpoint is not None and self._auto_checkpoint.due()
 
-            next_worker = action_response.action_args["location_id"]
-            print(f"Next worker selected: {next_worker}")
-            self.current_worker_id = next_worker
+    def step(self):
+        timer = self._new_step_timer()
+        location = self.current_worker_id
+        function_result = None
 
-        else:
-            raise ValueError(
-                f"Unknown action type: {action_response.action_type}")
+        if self._states_stale():
+            start = timer.start()
+            self._refresh_states()
+            timer.stop(PHASE_STATE, start)
 
-        # update agent state
-        self.agent_state = self.get_agent_state_fn(
-            self._session.function_result, self.agent_state)
+        # get next task/action from GAME API
+        action_response = self._get_action(self._session.function_result, timer)
+        function = self._select_function(action_response)
 
-    def run(self):
-        self._session = Session()
+        # execute action
+        if function is not None:
+            start = timer.start()
+            function_result = function.execute(**action_response.action_args)
+            timer.stop(PHASE_EXECUTE, start)
+            self._on_function_result(function_result)
+
+            # update worker states - if enabled, concurrently with the agent state below and the next
+            # payload (the step does not wait for it, see worker_states)
+            start = timer.start()
+            if self._concurrent_state_fns:
+                self._join_worker_state()
+                self._worker_state_future = get_state_executor().submit(
+                    self._update_worker_state, self.current_worker_id, function_result)
+            else:
+                self._update_worker_state(self.current_worker_id, function_result)
+            timer.stop(PHASE_STATE, start)
+
+        # update agent state
+        start = timer.start()
+        if self._agent_state_due(function_result):
+            self.agent_state = self.get_agent_state_fn(
+                self._session.function_result, self.agent_state)
+        timer.stop(PHASE_STATE, start)
+
+        if self._end_step(action_response, timer, location, function_result):
+            self._auto_checkpoint.write(self._checkpoint_data())
+
+        return action_response
+
+    def run(self, pacing: Optional[Pacing] = None):
+        """
+        Step the agent forever - back to back, or at the pace of `pacing` (e.g. `Pacing(heartbeat=60)`)
+        """
+        if not self._resume_session:
+            self._session = Session(self._session.history)
+        self._resume_session = False
         while True:
-            self.step()
+            action_response = self.step()
+            if pacing is None:
+                continue
+            delay = pacing.next_delay(action_response.action_type)
+            if delay > 0 and self._wakeup.wait(delay):
+                # woken up by an event
+                pacing.reset()
+            self._wakeup.clear()
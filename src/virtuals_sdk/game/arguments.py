@@ -0,0 +1,215 @@
+"""
+Argument plans of functions: the arguments GAME passes to a function are unwrapped, checked
+and coerced to their declared types before the executable runs, with a plan compiled once
+from the function's `args`.
+
+Declared types coerced: "string", "number", "integer", "boolean", "array", "object" and
+"null" (a list of types accepts any of them). Arguments of other types (e.g. "item") are
+passed as is. Arguments GAME passes that are not declared are passed as is as well.
+"""
+import json
+import math
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, Union
+
+_MISSING = object()
+
+
+class ArgumentError(ValueError):
+    """An argument passed by GAME is missing or does not match its declared type"""
+
+
+def _coerce_string(value: Any) -> Any:
+    if type(value) is str:
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise TypeError
+
+
+def _coerce_integer(value: Any) -> Any:
+    if type(value) is int:
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            number = float(value)
+            if number.is_integer():
+                return int(number)
+    raise TypeError
+
+
+def _coerce_number(value: Any) -> Any:
+    if type(value) is float or type(value) is int:
+        if math.isfinite(value):
+            return value
+    elif isinstance(value, str):
+        value = value.strip()
+        try:
+            return int(value)
+        except ValueError:
+            number = float(value)
+            if math.isfinite(number):
+                return number
+    raise TypeError
+
+
+_BOOLEANS = {"true": True, "false": False, "yes": True, "no": False, "1": True, "0": False}
+
+
+def _coerce_boolean(value: Any) -> Any:
+    if type(value) is bool:
+        return value
+    if isinstance(value, str):
+        return _BOOLEANS[value.strip().lower()]
+    if type(value) is int and value in (0, 1):
+        return bool(value)
+    raise TypeError
+
+
+def _coerce_json(expected: type) -> Callable[[Any], Any]:
+    def coerce(value: Any) -> Any:
+        if type(value) is expected:
+            return value
+        if expected is list and isinstance(value, tuple):
+            return list(value)
+        if isinstance(value, str):
+            # serialized by the model
+            value = json.loads(value)
+            if type(value) is expected:
+                return value
+        raise TypeError
+
+    return coerce
+
+
+def _coerce_null(value: Any) -> Any:
+    if value is None:
+        return None
+    raise TypeError
+
+
+_COERCERS: Dict[str, Callable[[Any], Any]] = {
+    "string": _coerce_string,
+    "str": _coerce_string,
+    "integer": _coerce_integer,
+    "int": _coerce_integer,
+    "number": _coerce_number,
+    "float": _coerce_number,
+    "boolean": _coerce_boolean,
+    "bool": _coerce_boolean,
+    "array": _coerce_json(list),
+    "list": _coerce_json(list),
+    "object": _coerce_json(dict),
+    "dict": _coerce_json(dict),
+    "null": _coerce_null,
+}
+
+
+def get_coercer(arg_type: Union[str, Sequence[str], None]) -> Optional[Callable[[Any], Any]]:
+    """Coercion of a declared type (None if values of the type are passed as is)"""
+    if arg_type is None:
+        return None
+    if isinstance(arg_type, str):
+        return _COERCERS.get(arg_type.lower())
+    coercers = [_COERCERS.get(t.lower()) for t in arg_type]
+    if not coercers or None in coercers:
+        return None
+    if len(coercers) == 1:
+        return coercers[0]
+
+    def coerce_any(value: Any) -> Any:
+        for coerce in coercers:
+            try:
+                return coerce(value)
+            except (TypeError, ValueError, KeyError):
+                pass
+        raise TypeError
+
+    return coerce_any
+
+
+def _type_name(arg_type: Union[str, Sequence[str]]) -> str:
+    return arg_type if isinstance(arg_type, str) else " or ".join(arg_type)
+
+
+# values of these exact types are passed without calling the coercion of their declared type
+_EXACT_TYPES: Dict[str, type] = {
+    "string": str, "str": str,
+    "integer": int, "int": int,
+    "boolean": bool, "bool": bool,
+    "array": list, "list": list,
+    "object": dict, "dict": dict,
+}
+
+
+def _get_default(argument: Any) -> Any:
+    """Default of an optional argument, or _MISSING without one (default=None is a default too)"""
+    fields_set = getattr(argument, "model_fields_set", None)
+    if fields_set is not None:
+        return argument.default if "default" in fields_set else _MISSING
+    default = getattr(argument, "default", None)
+    return default if default is not None else _MISSING
+
+
+class ArgumentPlan:
+    """
+    Unwrapping, checks and coercion of the arguments of a function, compiled from its `args`
+    """
+
+    __slots__ = ("_specs", "_types")
+
+    def __init__(self, arguments: Sequence[Any]):
+        # arguments: the Arguments of the function (name, type, optional, default)
+        # specs: (name, required, exact type, coercion, default) - unpacked on every call
+        specs = []
+        self._types: Dict[str, Any] = {}
+        for a in arguments:
+            arg_type = a.type
+            exact = _EXACT_TYPES.get(arg_type.lower()) if isinstance(arg_type, str) else None
+            default = _get_default(a) if a.optional else _MISSING
+            specs.append((a.name, not a.optional, exact, get_coercer(arg_type), default))
+            self._types[a.name] = arg_type
+        self._specs: Tuple[Tuple[str, bool, Optional[type], Optional[Callable[[Any], Any]], Any], ...] = tuple(specs)
+
+    def process(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Keyword arguments of the executable for the arguments of a GAME action,
+        raising ArgumentError if one is missing or invalid
+        """
+        processed = {}
+        found = 0
+        for name, required, exact, coerce, default in self._specs:
+            value = args.get(name, _MISSING)
+            if value is _MISSING:
+                if required:
+                    raise ArgumentError(f"Missing required argument: {name}")
+                if default is not _MISSING:
+                    processed[name] = default
+                continue
+            found += 1
+            # GAME passes values as {"value": ...}
+            if type(value) is dict and "value" in value:
+                value = value["value"]
+            if value is None:
+                if required:
+                    raise ArgumentError(f"Missing required argument: {name}")
+            elif coerce is not None and type(value) is not exact:
+                try:
+                    value = coerce(value)
+                except (TypeError, ValueError, KeyError):
+                    raise ArgumentError(
+                        f"Invalid argument {name}: expected {_type_name(self._types[name])}, got {value!r:.100}"
+                    ) from None
+            processed[name] = value
+
+        if found < len(args):
+            # arguments that are not declared
+            for name, value in args.items():
+                if name not in processed:
+                    if type(value) is dict and "value" in value:
+                        value = value["value"]
+                    processed[name] = value
+        return processed
@@ -0,0 +1,267 @@
+import asyncio
+import functools
+import inspect
+from typing import Callable, List, Optional, Union
+from virtuals_sdk.game.agent import Agent, Session, WorkerConfig, get_state_executor
+from virtuals_sdk.game.async_worker import AsyncWorker
+from virtuals_sdk.game.custom_types import FunctionResult, ActionResponse
+from virtuals_sdk.game.utils import GameAPIError, async_post, call_maybe_async
+from virtuals_sdk.game.observers import (
+    NULL_STEP_TIMER, PHASE_EXECUTE, PHASE_STATE, StepObserver, StepTimer,
+)
+from virtuals_sdk.game.pacing import Pacing
+from virtuals_sdk.game.provisioning import ProvisioningCache
+from virtuals_sdk.game.retry import RetryPolicy
+from virtuals_sdk.game.state_budget import StateBudget
+from virtuals_sdk.game.worker_pool import WorkerPool
+from virtuals_sdk.transport import AsyncHTTPTransport, get_default_async_transport
+
+
+class AsyncAgent(Agent):
+    """
+    asyncio counterpart of Agent - a single event loop can drive a large number of agents.
+    Executables, get_agent_state_fn and worker get_state_fn can be regular or `async def` functions.
+
+    The agent is created on the GAME API in `compile` (instead of the constructor) so that
+    constructing an AsyncAgent never blocks the event loop.
+    """
+
+    def __init__(self,
+                 api_key: str,
+                 name: str,
+                 agent_goal: str,
+                 agent_description: str,
+                 get_agent_state_fn: Callable,
+                 workers: Optional[List[WorkerConfig]] = None,
+                 transport: Optional[AsyncHTTPTransport] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 send_state_diffs: bool = False,
+                 base_url: Optional[str] = None,
+                 token_url: Optional[str] = None,
+                 observer: Optional[StepObserver] = None,
+                 verbose: bool = True,
+                 history_size: int = 100,
+                 history_path: Optional[str] = None,
+                 concurrent_state_fns: bool = False,
+                 worker_pool: Optional[WorkerPool] = None,
+                 provisioning_cache: Union[str, ProvisioningCache, None] = None,
+                 checkpoint_path: Optional[str] = None,
+                 checkpoint_interval: Optional[float] = None,
+                 lazy_states: bool = False,
+                 strict_responses: bool = False,
+                 state_budget: Optional[StateBudget] = None,
+                 agent_state_budget: Optional[StateBudget] = None,
+                 ):
+        self._async_transport: AsyncHTTPTransport = transport or get_default_async_transport()
+        # loop and event of a paced run loop (woken up by notify)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_wakeup: Optional[asyncio.Event] = None
+        super().__init__(
+            api_key=api_key,
+            name=name,
+            agent_goal=agent_goal,
+            agent_description=agent_description,
+            get_agent_state_fn=get_agent_state_fn,
+            workers=workers,
+            transport=self._async_transport.transport,
+            retry_policy=retry_policy,
+            send_state_diffs=send_state_diffs,
+            base_url=base_url,
+            token_url=token_url,
+            observer=observer,
+            verbose=verbose,
+            history_size=history_size,
+            history_path=history_path,
+            concurrent_state_fns=concurrent_state_fns,
+            worker_pool=worker_pool,
+            provisioning_cache=provisioning_cache,
+            checkpoint_path=checkpoint_path,
+            checkpoint_interval=checkpoint_interval,
+            lazy_states=lazy_states,
+            strict_responses=strict_responses,
+            state_budget=state_budget,
+            agent_state_budget=agent_state_budget,
+        )
+
+    def _provision(self):
+        # deferred to compile so the constructor never blocks the event loop
+        pass
+
+    async def _aprovision(self):
+        """ Set up the initial agent state and create the agent"""
+        self.agent_state = await call_maybe_async(self.get_agent_state_fn, None, None)
+
+        self.agent_id = await self._async_transport.run(self._get_or_create_agent_id)
+
+    async def compile(self):
+        """ Compile the workers for the agent - i.e. set up task generator"""
+        workers_list = self._compile_workers()
+
+        if self.agent_id is None:
+            await self._aprovision()
+
+        self._map_id = await self._async_transport.run(self._get_or_create_map_id, workers_list)
+
+        # initialize and set up worker states
+        for worker_id, fn, args in self._initial_state_calls(workers_list):
+            self._set_state(worker_id, await call_maybe_async(fn, *args))
+
+        return self._map_id
+
+    def get_worker(self, worker_id: str):
+        """Initialize a working interactable standalone async worker"""
+        worker_config = self.get_worker_config(worker_id)
+        return AsyncWorker(
+            api_key=self._api_key,
+            # THIS DESCRIPTION IS THE AGENT DESCRIPTION/CHARACTER CARD - WORKER DESCRIPTION IS ONLY USED FOR THE TASK GENERATOR
+            description=self.agent_description,
+            instruction=worker_config.instruction,
+            get_state_fn=worker_config.get_state_fn,
+            action_space=worker_config.action_space,
+            transport=self._async_transport,
+            retry_policy=self._retry_policy,
+            token_url=self._token_url,
+            send_state_diffs=self._send_state_diffs,
+            base_url=self._base_url,
+            observer=self._observer,
+            verbose=False,
+            worker_pool=self._worker_pool,
+            strict_responses=self._strict_responses,
+            state_budget=self._state_budget,
+            state_budget_key=worker_id,
+        )
+
+    async def _get_action(
+        self,
+        function_result: Optional[FunctionResult] = None,
+        timer: StepTimer = NULL_STEP_TIMER,
+    ) -> ActionResponse:
+
+        data = self._build_action_data(function_result, timer)
+
+        resynced = False
+        try:
+            while True:
+                try:
+                    response = await self._apost_action(data, timer)
+                    break
+                except GameAPIError as e:
+                    recovery = self._get_recovery(e, resynced)
+                    if recovery is None:
+                        raise
+                    if recovery == "resync":
+                        # state diffs could not be applied - send the full states
+                        resynced = True
+                    else:
+                        # the agent or map from the provisioning cache no longer exists - create it again
+                        await self._async_transport.run(self._reprovision, e)
+                data = self._resync_states(function_result, timer)
+        except BaseException:
+            # the API may not have applied the states sent - send them in full with the next step
+            self._reset_state_encoders()
+            raise
+
+        return self._decode_action(data, response, timer)
+
+    async def _apost_action(self, data: dict, timer: StepTimer) -> dict:
+        return await async_post(
+            base_url=self._base_url,
+            api_key=self._api_key,
+            endpoint=f"/v2/agents/{self.agent_id}/actions",
+            data=data,
+            transport=self._async_transport,
+            retry_policy=self._retry_policy,
+            token_url=self._token_url,
+            timer=timer,
+        )
+
+    async def _arefresh_states(self):
+        """ Initialize the state of the current worker if needed and re-run invalidated state functions"""
+        for worker_id, fn, args in self._refresh_state_calls():
+            self._set_state(worker_id, await call_maybe_async(fn, *args))
+
+    async def step(self):
+        timer = self._new_step_timer()
+        location = self.current_worker_id
+        function_result = None
+
+        if self._states_stale():
+            start = timer.start()
+            await self._arefresh_states()
+            timer.stop(PHASE_STATE, start)
+
+        # get next task/action from GAME API
+        action_response = await self._get_action(self._session.function_result, timer)
+        function = self._select_function(action_response)
+
+        # execute action
+        if function is not None:
+            start = timer.start()
+            function_result = await function.aexecute(**action_response.action_args)
+            timer.stop(PHASE_EXECUTE, start)
+            self._on_function_result(function_result)
+
+            # update worker states (together with the agent state below, if enabled)
+            if not self._concurrent_state_fns:
+                start = timer.start()
+                worker_id = self.current_worker_id
+                self.worker_states[worker_id] = await call_maybe_async(
+                    self.workers[worker_id].get_state_fn, function_result, self.worker_states[worker_id])
+                timer.stop(PHASE_STATE, start)
+
+        # update agent state
+        start = timer.start()
+        if self._concurrent_state_fns and function_result is not None:
+            worker_id = self.current_worker_id
+            self.worker_states[worker_id], self.agent_state = await asyncio.gather(
+                self._call_concurrent_state_fn(
+                    self.workers[worker_id].get_state_fn, function_result, self.worker_states[worker_id]),
+                call_maybe_async(self.get_agent_state_fn, function_result, self.agent_state),
+            )
+        elif self._agent_state_due(function_result):
+            self.agent_state = await call_maybe_async(
+                self.get_agent_state_fn, self._session.function_result, self.agent_state)
+        timer.stop(PHASE_STATE, start)
+
+        if self._end_step(action_response, timer, location, function_result):
+            await self._async_transport.run(self._auto_checkpoint.write, self._checkpoint_data())
+
+        return action_response
+
+    async def _call_concurrent_state_fn(self, fn: Callable, *args):
+        # a regular state function would block the event loop (and the other state function) - run on a thread
+        if inspect.iscoroutinefunction(fn):
+            return await fn(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_state_executor(), functools.partial(fn, *args))
+
+    def _wake(self):
+        loop, wakeup = self._loop, self._async_wakeup
+        if loop is not None and wakeup is not None:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    async def run(self, pacing: Optional[Pacing] = None):
+        """
+        Step the agent forever - back to back, or at the pace of `pacing` (e.g. `Pacing(heartbeat=60)`)
+        """
+        if not self._resume_session:
+            self._session = Session(self._session.history)
+        self._resume_session = False
+        self._loop = asyncio.get_running_loop()
+        self._async_wakeup = asyncio.Event()
+        try:
+            while True:
+                action_response = await self.step()
+                if pacing is None:
+                    continue
+                delay = pacing.next_delay(action_response.action_type)
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._async_wakeup.wait(), delay)
+                        # woken up by an event
+                        pacing.reset()
+                    except asyncio.TimeoutError:
+                        pass
+                self._async_wakeup.clear()
+        finally:
+            self._loop = None
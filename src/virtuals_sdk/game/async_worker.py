@@ -0,0 +1,230 @@
+import asyncio
+import itertools
+from typing import AsyncIterator, Callable, Iterable, List, Optional
+from virtuals_sdk.game.worker import TaskResult, Worker
+from virtuals_sdk.game.custom_types import Function, EMPTY_FUNCTION_RESULT, FunctionResult, ActionResponse
+from virtuals_sdk.game.utils import GameAPIError, async_post, call_maybe_async
+from virtuals_sdk.game.observers import (
+    NULL_STEP_TIMER, PHASE_EXECUTE, PHASE_STATE, StepObserver, StepTimer,
+)
+from virtuals_sdk.game.retry import RetryPolicy
+from virtuals_sdk.game.state_budget import StateBudget
+from virtuals_sdk.game.worker_pool import WorkerPool
+from virtuals_sdk.transport import AsyncHTTPTransport, get_default_async_transport
+
+
+class AsyncWorker(Worker):
+    """
+    asyncio counterpart of Worker - many workers can be driven from a single event loop.
+    Executables and get_state_fn can be regular or `async def` functions.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        description: str,  # description of the worker/character card (PROMPT)
+        get_state_fn: Callable,
+        action_space: List[Function],
+        # specific additional instruction for the worker (PROMPT)
+        instruction: Optional[str] = "",
+        transport: Optional[AsyncHTTPTransport] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        send_state_diffs: bool = False,
+        base_url: Optional[str] = None,
+        token_url: Optional[str] = None,
+        observer: Optional[StepObserver] = None,
+        verbose: bool = True,
+        worker_pool: Optional[WorkerPool] = None,
+        checkpoint_path: Optional[str] = None,
+        checkpoint_interval: Optional[float] = None,
+        strict_responses: bool = False,
+        state_budget: Optional[StateBudget] = None,
+        state_budget_key: Optional[str] = None,
+    ):
+        self._async_transport: AsyncHTTPTransport = transport or get_default_async_transport()
+        super().__init__(
+            api_key=api_key,
+            description=description,
+            get_state_fn=get_state_fn,
+            action_space=action_space,
+            instruction=instruction,
+            transport=self._async_transport.transport,
+            retry_policy=retry_policy,
+            send_state_diffs=send_state_diffs,
+            base_url=base_url,
+            token_url=token_url,
+            observer=observer,
+            verbose=verbose,
+            worker_pool=worker_pool,
+            checkpoint_path=checkpoint_path,
+            checkpoint_interval=checkpoint_interval,
+            strict_responses=strict_responses,
+            state_budget=state_budget,
+            state_budget_key=state_budget_key,
+        )
+
+    def _provision(self):
+        # deferred to the first set_task so the constructor never blocks the event loop
+        pass
+
+    async def _aprovision(self):
+        """
+        Sets up the initial state and creates the agent instance for the worker
+        """
+        self.state = await call_maybe_async(self.get_state_fn, EMPTY_FUNCTION_RESULT, None)
+
+        if self._worker_pool is None:
+            self._agent_id = await self._acreate_remote_agent()
+        else:
+            self._agent_id = await self._worker_pool.aget_agent_id(self._pool_key(), self._acreate_remote_agent)
+
+    async def _acreate_remote_agent(self) -> str:
+        return await self._async_transport.run(self._create_remote_agent)
+
+    async def set_task(self, task: str):
+        """
+        Sets the task for the agent
+        """
+        if self._agent_id is None:
+            await self._aprovision()
+
+        set_task_response = await async_post(
+            base_url=self._base_url,
+            api_key=self._api_key,
+            endpoint=f"/v2/agents/{self._agent_id}/tasks",
+            data={"task": task},
+            transport=self._async_transport,
+            retry_policy=self._retry_policy,
+            token_url=self._token_url,
+        )
+
+        # task ID
+        self._submission_id = set_task_response["submission_id"]
+        # new task - the state is sent in full with its first step
+        self._state_encoder.reset()
+
+        return self._submission_id
+
+    async def _get_action(
+        self,
+        # results of the previous action (if any)
+        function_result: Optional[FunctionResult] = None,
+        timer: StepTimer = NULL_STEP_TIMER,
+    ) -> ActionResponse:
+        """
+        Gets the agent action from the GAME API
+        """
+        data = self._build_action_data(function_result, timer)
+
+        resynced = False
+        try:
+            while True:
+                try:
+                    response = await async_post(
+                        base_url=self._base_url,
+                        api_key=self._api_key,
+                        endpoint=self._next_endpoint(),
+                        data=data,
+                        transport=self._async_transport,
+                        retry_policy=self._retry_policy,
+                        token_url=self._token_url,
+                        timer=timer,
+                    )
+                    break
+                except GameAPIError as e:
+                    if self._get_recovery(e, resynced) is None:
+                        raise
+                    # state diff could not be applied - send the full state
+                    resynced = True
+                data = self._resync_state(function_result, timer)
+        except BaseException:
+            # the API may not have applied the state sent - send it in full with the next step
+            self._reset_state_encoders()
+            raise
+
+        return self._decode_action(response, timer)
+
+    async def step(self):
+        """
+        Execute the next step in the task - requires a task ID (i.e. task ID)
+        """
+        timer = self._start_step()
+        submission_id = self._submission_id
+        function_result = None
+
+        # get action from GAME API (Agent)
+        action_response = await self._get_action(self._function_result, timer)
+        function = self._select_function(action_response)
+
+        # execute action
+        if function is not None:
+            start = timer.start()
+            function_result = await function.aexecute(**action_response.action_args)
+            timer.stop(PHASE_EXECUTE, start)
+            self._on_function_result(function_result)
+
+            # update state
+            start = timer.start()
+            self.state = await call_maybe_async(self.get_state_fn, function_result, self.state)
+            timer.stop(PHASE_STATE, start)
+
+        if self._end_step(action_response, timer, submission_id, function_result):
+            await self._async_transport.run(self._auto_checkpoint.write, self._checkpoint_data())
+
+        return action_response, self._function_result
+
+    async def _run_task(self, index: int, task: str) -> TaskResult:
+        worker = self._fork()
+        result = TaskResult(index=index, task=task)
+        try:
+            worker.state = await call_maybe_async(worker.get_state_fn, EMPTY_FUNCTION_RESULT, None)
+            result.submission_id = await worker.set_task(task)
+            while worker._submission_id:
+                await worker.step()
+                result.steps += 1
+        except Exception as e:
+            result.error = e
+        result.state = worker.state
+        result.function_result = worker._function_result
+        return result
+
+    async def run_many(self, tasks: Iterable[str], concurrency: int = 4) -> AsyncIterator[TaskResult]:
+        """
+        Runs tasks concurrently (at most `concurrency` at a time) on the remote agent of the worker,
+        each with its own task ID and state, and yields their results as they complete.
+        Tasks are taken from `tasks` as slots free up, so it can be a long (or endless) iterator.
+        A failed task does not stop the others - its exception is in its result.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if self._agent_id is None:
+            # provisioned once, before the tasks share it
+            await self._aprovision()
+        tasks = enumerate(tasks)
+        pending = {
+            asyncio.ensure_future(self._run_task(index, task))
+            for index, task in itertools.islice(tasks, concurrency)
+        }
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    for index, task in itertools.islice(tasks, 1):
+                        pending.add(asyncio.ensure_future(self._run_task(index, task)))
+                    yield future.result()
+        finally:
+            # the iteration was stopped early
+            for future in pending:
+                future.cancel()
+
+    async def run(self, task: Optional[str] = None):
+        """
+        Gets the agent to complete the task on its own autonomously
+        (None to continue the current task, e.g. a restored one)
+        """
+        if task is not None:
+            await self.set_task(task)
+        elif not self._submission_id:
+            raise ValueError("No task set")
+        while self._submission_id:
+            await self.step()
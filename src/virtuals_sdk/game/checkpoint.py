@@ -0,0 +1,74 @@
+"""
+Checkpoints of agent and worker sessions, so a restarted process can resume where it left off.
+
+Checkpoints are compact JSON files (gzipped if the path ends with `.gz`), written atomically
+and synced to disk: a checkpoint is either the previous one or the new one, never a partially
+written (or empty) file.
+"""
+import gzip
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+CHECKPOINT_VERSION = 1
+
+
+def write_checkpoint(path: str, data: Dict[str, Any]):
+    """Atomically write a checkpoint (states must be JSON serializable, as they are sent to GAME)"""
+    content = json.dumps(
+        {"version": CHECKPOINT_VERSION, "time": time.time(), **data},
+        separators=(",", ":"), ensure_ascii=False,
+    ).encode("utf-8")
+    if path.endswith(".gz"):
+        # mtime=0 so identical checkpoints give identical files
+        content = gzip.compress(content, compresslevel=1, mtime=0)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".checkpoint-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            # on disk before the rename, so a crash can not leave an empty file
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def read_checkpoint(path: str, kind: str) -> Optional[Dict[str, Any]]:
+    """Read a checkpoint of `kind` ("agent", "worker") - None if there is none at `path`"""
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+    except FileNotFoundError:
+        return None
+    if path.endswith(".gz"):
+        content = gzip.decompress(content)
+    data = json.loads(content)
+    if data.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version: {data.get('version')}")
+    if data.get("kind") != kind:
+        raise ValueError(f"Not a checkpoint of a {kind}: {path}")
+    return data
+
+
+class AutoCheckpoint:
+    """
+    Checkpoints taken after steps, at most every `interval` seconds (0 for after every step)
+    """
+
+    def __init__(self, path: str, interval: float = 0.0):
+        self.path = path
+        self.interval = interval
+        self._last = time.monotonic()
+
+    def due(self) -> bool:
+        return time.monotonic() - self._last >= self.interval
+
+    def write(self, data: Dict[str, Any]):
+        write_checkpoint(self.path, data)
+        self._last = time.monotonic()
@@ -1,8 +1,18 @@
+import asyncio
+import copy
+import functools
+import inspect
+import itertools
+import json
+import time
 from typing import Any, Dict, Optional, List, Union, Sequence, Callable, Tuple
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, TypeAdapter
 from enum import Enum
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
+from virtuals_sdk.game.arguments import ArgumentError, ArgumentPlan
+from virtuals_sdk.game.execution import ExecutionBackend, ExecutionTimeout, get_backend, run_executable
+from virtuals_sdk.game.result_cache import CacheKey, ResultCache, default_result_cache
 
 
 class Argument(BaseModel):
@@ -10,18 +20,142 @@ class Argument(BaseModel):
     description: str
     type: Optional[Union[List[str], str]] = None
     optional: Optional[bool] = False
+    # value passed to the executable when GAME does not pass the (optional) argument - only if set
+    # (an explicit default=None is passed as None)
+    default: Optional[Any] = None
 
 class FunctionResultStatus(str, Enum):
     DONE = "done"
     FAILED = "failed"
 
-class FunctionResult(BaseModel):
+class _FunctionResultModel(BaseModel):
+    # the pydantic model FunctionResult used to be - validates, serializes and describes results
+    model_config = ConfigDict(title="FunctionResult")
+
     action_id: str
     action_status: FunctionResultStatus
     feedback_message: Optional[str] = None
     info: Optional[Dict[str, Any]] = None
 
+
+class FunctionResult:
+    """
+    Result of a function call. Immutable, so results can be shared (see `EMPTY_FUNCTION_RESULT`)
+    and the part sent to GAME is only built once (`to_wire`).
+
+    Not a pydantic model (since 0.2.0): the constructor only converts `action_status`, use
+    `model_validate` to validate all fields. The pydantic methods in use are kept as shims.
+    """
+    __slots__ = ("action_id", "action_status", "feedback_message", "info", "_wire")
+
+    def __init__(self, action_id: str, action_status: Union[FunctionResultStatus, str],
+                 feedback_message: Optional[str] = None, info: Optional[Dict[str, Any]] = None):
+        # slots are set through their descriptors (__setattr__ is disabled), see below the class
+        _set_action_id(self, action_id)
+        _set_action_status(self, action_status if type(action_status) is FunctionResultStatus
+                           else FunctionResultStatus(action_status))
+        _set_feedback_message(self, feedback_message)
+        _set_info(self, info)
+        _set_wire(self, None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"FunctionResult is immutable (cannot set {name})")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"FunctionResult is immutable (cannot delete {name})")
+
+    def __reduce__(self):
+        return FunctionResult, (self.action_id, self.action_status, self.feedback_message, self.info)
+
+    def __eq__(self, other):
+        if not isinstance(other, FunctionResult):
+            return NotImplemented
+        return (
+            self.action_id == other.action_id
+            and self.action_status == other.action_status
+            and self.feedback_message == other.feedback_message
+            and self.info == other.info
+        )
+
+    __hash__ = None
+
+    def __repr__(self):
+        return (
+            f"FunctionResult(action_id={self.action_id!r}, action_status={self.action_status!r}, "
+            f"feedback_message={self.feedback_message!r}, info={self.info!r})"
+        )
+
+    def to_wire(self) -> Dict[str, Any]:
+        """The result as sent to GAME (without info) - built once, must not be modified"""
+        wire = self._wire
+        if wire is None:
+            wire = {
+                "action_id": self.action_id,
+                "action_status": self.action_status.value,
+                "feedback_message": self.feedback_message,
+            }
+            _set_wire(self, wire)
+        return wire
+
+    def model_dump(self, exclude: Optional[set] = None, mode: str = "python") -> Dict[str, Any]:
+        """The result as a dict (same interface as the pydantic model FunctionResult used to be)"""
+        data = {
+            "action_id": self.action_id,
+            "action_status": self.action_status.value if mode == "json" else self.action_status,
+            "feedback_message": self.feedback_message,
+            "info": self.info,
+        }
+        for name in exclude or ():
+            data.pop(name, None)
+        return data
+
+    def model_copy(self, update: Optional[Dict[str, Any]] = None) -> "FunctionResult":
+        # immutable - a copy is only needed to change fields
+        if not update:
+            return self
+        return FunctionResult(**{**self.model_dump(), **update})
+
+    def model_dump_json(self, exclude: Optional[set] = None, indent: Optional[int] = None) -> str:
+        return _FunctionResultModel.model_construct(**self.model_dump()).model_dump_json(
+            exclude=exclude, indent=indent)
+
+    @classmethod
+    def model_validate(cls, data: Union["FunctionResult", Dict[str, Any]]) -> "FunctionResult":
+        """Result from a dict, validated as by the pydantic model (raises pydantic.ValidationError)"""
+        if isinstance(data, FunctionResult):
+            return data
+        return cls(**dict(_FunctionResultModel.model_validate(data)))
+
+    @classmethod
+    def model_validate_json(cls, data: Union[str, bytes]) -> "FunctionResult":
+        return cls(**dict(_FunctionResultModel.model_validate_json(data)))
+
+    @classmethod
+    def model_json_schema(cls, **kwargs) -> Dict[str, Any]:
+        return _FunctionResultModel.model_json_schema(**kwargs)
+
+
+_set_action_id = FunctionResult.action_id.__set__
+_set_action_status = FunctionResult.action_status.__set__
+_set_feedback_message = FunctionResult.feedback_message.__set__
+_set_info = FunctionResult.info.__set__
+_set_wire = FunctionResult._wire.__set__
+
+# result passed to state functions before any function was called (shared - must not be modified)
+EMPTY_FUNCTION_RESULT = FunctionResult(
+    action_id="",
+    action_status=FunctionResultStatus.DONE,
+    feedback_message="",
+    info={},
+)
+
+# scopes of the cached results of functions (see Function._get_cache_scope)
+_cache_scopes = itertools.count()
+
+
 class Function(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     fn_name: str
     fn_description: str
     args: List[Argument]
@@ -32,31 +166,108 @@ class Function(BaseModel):
         default_factory=lambda: Function._default_executable
     )
 
+    # seconds the executable may run before the function fails (None for no limit)
+    timeout: Optional[float] = None
+    # where the executable runs: "inline" (the calling thread), "thread", "process" (see game.execution)
+    # or an ExecutionBackend - None runs it inline, or on the thread backend if a timeout is set
+    backend: Optional[Union[str, ExecutionBackend]] = None
+
+    # seconds the results of successful calls are reused for identical calls - for read-only
+    # executables (None to not cache results)
+    cache_ttl: Optional[float] = None
+    # cache of the results (defaults to the cache shared by all functions, keyed by fn_name and args)
+    cache: Optional[ResultCache] = None
+
+    # args the plan was compiled from, and the plan (see compile_args)
+    _argument_plan: Optional[Tuple[List[Argument], ArgumentPlan]] = PrivateAttr(default=None)
+    # executable the cached results are scoped to, and the scope (see _get_cache_scope)
+    _cache_scope: Optional[Tuple[Callable, str]] = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any):
+        self.compile_args()
+
+    def compile_args(self):
+        """Compile the argument plan (see game.arguments) again - after changing args in place"""
+        self._argument_plan = (self.args, ArgumentPlan(self.args))
+
     def get_function_def(self):
-        return self.model_dump(exclude={'executable'})
+        return self.model_dump(exclude={
+            'executable': True, 'timeout': True, 'backend': True, 'cache_ttl': True, 'cache': True,
+            'args': {'__all__': {'default'}},
+        })
 
     @staticmethod
     def _default_executable(**kwargs) -> Tuple[FunctionResultStatus, str]:
         """Default executable that does nothing"""
         return FunctionResultStatus.DONE, "Default implementation - no action taken", {}
     
+    def _process_args(self, args: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract values from the nested dictionary structure of GAME arguments, checked and coerced to their types."""
+        plan_args, plan = self._argument_plan
+        if plan_args is not self.args:
+            # args were replaced (e.g. model_copy(update=...))
+            self.compile_args()
+            plan = self._argument_plan[1]
+        return plan.process(args)
+
+    @property
+    def result_cache(self) -> ResultCache:
+        return self.cache if self.cache is not None else default_result_cache
+
+    def _get_cache_scope(self) -> str:
+        """Scope of the cached results: the executable (of this function - a new one gets a new scope)"""
+        scope = self._cache_scope
+        if scope is None or scope[0] is not self.executable:
+            scope = self._cache_scope = (self.executable, str(next(_cache_scopes)))
+        return scope[1]
+
+    def _get_cached(self, processed_args: Dict[str, Any]) -> Tuple[Optional[CacheKey], Optional[tuple]]:
+        """Cache key of the call and its cached (status, feedback, info) if any"""
+        if self.cache_ttl is None:
+            return None, None
+        key = ResultCache.key(self.fn_name, processed_args, self._get_cache_scope())
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            # each result gets its own info (it is not immutable)
+            status, feedback, info = cached
+            cached = status, feedback, copy.deepcopy(info)
+        return key, cached
+
+    def _put_cached(self, key: Optional[CacheKey], result: tuple):
+        # failures are not cached
+        if key is not None and result[0] == FunctionResultStatus.DONE:
+            status, feedback, info = result
+            self.result_cache.put(key, (status, feedback, copy.deepcopy(info)), self.cache_ttl)
+
+    def invalidate_cache(self, **args: Any):
+        """
+        Drop the cached results of the function (or only of the call with `args`, given as GAME
+        passes them or as plain values - they are coerced and completed with defaults as for a call,
+        raising ArgumentError if they are invalid)
+        """
+        self.result_cache.invalidate(
+            self.fn_name, self._process_args(args) if args else None, self._get_cache_scope())
+
     def execute(self, **kwds: Any) -> FunctionResult:
         """Execute the function using arguments from GAME action."""
         fn_id = kwds.get('fn_id')
         args = kwds.get('args', {})
 
         try:
-            # Extract values from the nested dictionary structure
-            processed_args = {}
-            for arg_name, arg_value in args.items():
-                if isinstance(arg_value, dict) and 'value' in arg_value:
-                    processed_args[arg_name] = arg_value['value']
-                else:
-                    processed_args[arg_name] = arg_value
-                    
+            processed_args = self._process_args(args)
+            cache_key, cached = self._get_cached(processed_args) if self.cache_ttl is not None else (None, None)
+
             # print("Processed args: ", processed_args)
-            # execute the function provided
-            status, feedback, info = self.executable(**processed_args)
+            # execute the function provided (unless its result is cached)
+            if cached is not None:
+                status, feedback, info = cached
+            elif self.backend is None and self.timeout is None:
+                status, feedback, info = self.executable(**processed_args)
+            else:
+                status, feedback, info = run_executable(
+                    self.executable, processed_args, self.timeout, self.backend)
+            if cache_key is not None and cached is None:
+                self._put_cached(cache_key, (status, feedback, info))
 
             return FunctionResult(
                 action_id=fn_id,
@@ -64,6 +275,14 @@ class Function(BaseModel):
                 feedback_message=feedback,
                 info=info,
             )
+        except ArgumentError as e:
+            # rejected before the executable runs
+            return FunctionResult(
+                action_id=fn_id,
+                action_status=FunctionResultStatus.FAILED,
+                feedback_message=f"Invalid arguments: {str(e)}",
+                info={},
+            )
         except Exception as e:
             return FunctionResult(
                 action_id=fn_id,
@@ -72,6 +291,245 @@ class Function(BaseModel):
                 info={},
             )
 
+    async def aexecute(self, **kwds: Any) -> FunctionResult:
+        """
+        Execute the function from an event loop. `async def` executables are awaited,
+        regular executables are run in the loop's executor (or on the function's backend)
+        so they do not block it.
+        """
+        fn_id = kwds.get('fn_id')
+        args = kwds.get('args', {})
+
+        try:
+            processed_args = self._process_args(args)
+            cache_key, cached = self._get_cached(processed_args) if self.cache_ttl is not None else (None, None)
+
+            if cached is not None:
+                status, feedback, info = cached
+            elif inspect.iscoroutinefunction(self.executable):
+                try:
+                    status, feedback, info = await asyncio.wait_for(
+                        self.executable(**processed_args), self.timeout)
+                except asyncio.TimeoutError:
+                    if self.timeout is None:
+                        raise
+                    raise ExecutionTimeout(f"Timed out after {self.timeout}s")
+            elif self.backend is None and self.timeout is None:
+                loop = asyncio.get_running_loop()
+                status, feedback, info = await loop.run_in_executor(
+                    None, functools.partial(self.executable, **processed_args))
+            else:
+                status, feedback, info = await self._aexecute_on_backend(processed_args)
+            if cache_key is not None and cached is None:
+                self._put_cached(cache_key, (status, feedback, info))
+
+            return FunctionResult(
+                action_id=fn_id,
+                action_status=status,
+                feedback_message=feedback,
+                info=info,
+            )
+        except ArgumentError as e:
+            # rejected before the executable runs
+            return FunctionResult(
+                action_id=fn_id,
+                action_status=FunctionResultStatus.FAILED,
+                feedback_message=f"Invalid arguments: {str(e)}",
+                info={},
+            )
+        except Exception as e:
+            return FunctionResult(
+                action_id=fn_id,
+                action_status=FunctionResultStatus.FAILED,
+                feedback_message=f"Error executing function: {str(e)}",
+                info={},
+            )
+
+    async def _aexecute_on_backend(self, processed_args: Dict[str, Any]):
+        backend = get_backend(self.backend)
+        future = backend.submit(self.executable, processed_args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            if future.done():
+                raise
+            backend.cancel(future)
+            raise ExecutionTimeout(f"Timed out after {self.timeout}s")
+
+class RawJSON(str):
+    """
+    A value that is already serialized to JSON - it is placed into request bodies as is
+    instead of being serialized again (see `utils.dumps_payload`).
+    """
+
+
+class ActionSpace(dict):
+    """
+    Functions available to a worker, keyed by fn_name.
+
+    The function definitions sent to GAME on every step are computed and serialized once
+    and reused until the action space is modified (adding/removing functions through the
+    dict interface). Call `invalidate()` after changing a function in place.
+
+    Functions can be made unavailable for some steps, so GAME is only shown the functions it
+    can currently use (see `step_function_defs`):
+    - with a predicate, evaluated before every step (e.g. `lambda: wallet.balance > 0`)
+    - by masking them, until they are unmasked or for some time (e.g. after being rate limited)
+    """
+
+    def __init__(self, functions: Union[Sequence[Function], Dict[str, Function], None] = None,
+                 predicates: Optional[Dict[str, Callable[[], bool]]] = None):
+        if isinstance(functions, dict):
+            super().__init__(functions)
+        else:
+            super().__init__((f.fn_name, f) for f in functions or [])
+        self._function_defs: Optional[List[dict]] = None
+        self._serialized_function_defs: Optional[RawJSON] = None
+        # fn_name -> predicate telling if the function is available
+        self._predicates: Dict[str, Callable[[], bool]] = dict(predicates or {})
+        # fn_name -> time.monotonic() the function is unmasked at (None: until unmask)
+        self._masked: Dict[str, Optional[float]] = {}
+        # serialized definition of each function, and serialized definitions of the available
+        # functions keyed by the unavailable ones
+        self._serialized_defs: Optional[Dict[str, str]] = None
+        self._subset_defs: Dict[frozenset, RawJSON] = {}
+
+    def invalidate(self):
+        """Drop the cached function definitions."""
+        self._function_defs = None
+        self._serialized_function_defs = None
+        self._serialized_defs = None
+        self._subset_defs = {}
+
+    @property
+    def function_defs(self) -> List[dict]:
+        """Function definitions of all functions in the action space."""
+        if self._function_defs is None:
+            self._function_defs = [f.get_function_def() for f in self.values()]
+        return self._function_defs
+
+    @property
+    def serialized_function_defs(self) -> RawJSON:
+        """Function definitions of all functions in the action space, serialized to JSON."""
+        if self._serialized_function_defs is None:
+            self._serialized_function_defs = RawJSON(
+                json.dumps(self.function_defs, separators=(",", ":"), allow_nan=False))
+        return self._serialized_function_defs
+
+    def set_predicate(self, fn_name: str, predicate: Optional[Callable[[], bool]]):
+        """Make a function available only when `predicate()` is true (None to remove the predicate)"""
+        if predicate is None:
+            self._predicates.pop(fn_name, None)
+        else:
+            self._predicates[fn_name] = predicate
+
+    def mask(self, fn_name: str, duration: Optional[float] = None):
+        """Make a function unavailable, for `duration` seconds or until it is unmasked"""
+        self._masked[fn_name] = None if duration is None else time.monotonic() + duration
+
+    def unmask(self, fn_name: str):
+        self._masked.pop(fn_name, None)
+
+    def is_available(self, fn_name: str) -> bool:
+        """Whether a function is currently available (not masked, and its predicate is true if it has one)"""
+        if fn_name in self._masked:
+            until = self._masked[fn_name]
+            if until is None or until > time.monotonic():
+                return False
+            # mask expired
+            self._masked.pop(fn_name, None)
+        predicate = self._predicates.get(fn_name)
+        return predicate is None or bool(predicate())
+
+    def unavailable(self) -> frozenset:
+        """Names of the functions that are currently unavailable"""
+        if not self._masked and not self._predicates:
+            return frozenset()
+        names = set(self._masked).union(self._predicates)
+        return frozenset(name for name in names if name in self and not self.is_available(name))
+
+    def step_function_defs(self) -> RawJSON:
+        """
+        Definitions of the currently available functions, serialized to JSON (sent on every step).
+        Each definition is serialized once, so changes of availability do not serialize them again.
+        """
+        if not self._masked and not self._predicates:
+            return self.serialized_function_defs
+        unavailable = self.unavailable()
+        if not unavailable:
+            return self.serialized_function_defs
+        defs = self._subset_defs.get(unavailable)
+        if defs is None:
+            if self._serialized_defs is None:
+                self._serialized_defs = {
+                    name: json.dumps(d, separators=(",", ":"), allow_nan=False)
+                    for name, d in zip(self.keys(), self.function_defs)
+                }
+            defs = RawJSON("[" + ",".join(
+                d for name, d in self._serialized_defs.items() if name not in unavailable) + "]")
+            if len(self._subset_defs) >= 64:
+                # availability changes a lot - only keep recent subsets
+                self._subset_defs.clear()
+            self._subset_defs[unavailable] = defs
+        return defs
+
+    def get_function(self, fn_name: str) -> Function:
+        """
+        Function selected by GAME - if it became unavailable since the step was sent,
+        a function failing without running the executable is returned instead.
+        """
+        function = self[fn_name]
+        if (self._masked or self._predicates) and not self.is_available(fn_name):
+            return _unavailable_function(function)
+        return function
+
+    def add(self, function: Function):
+        self[function.fn_name] = function
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.invalidate()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.invalidate()
+
+    def pop(self, *args):
+        result = super().pop(*args)
+        self.invalidate()
+        return result
+
+    def popitem(self):
+        result = super().popitem()
+        self.invalidate()
+        return result
+
+    def setdefault(self, key, default=None):
+        result = super().setdefault(key, default)
+        self.invalidate()
+        return result
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.invalidate()
+
+    def clear(self):
+        super().clear()
+        self.invalidate()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+
+def _unavailable_function(function: Function) -> Function:
+    def unavailable(**kwargs):
+        return FunctionResultStatus.FAILED, f"Function {function.fn_name} is not available at the moment", {}
+
+    return Function(fn_name=function.fn_name, fn_description=function.fn_description, args=[],
+                    executable=unavailable)
+
+
 # Different ActionTypes returned by the GAME API
 class ActionType(Enum):
     CALL_FUNCTION = "call_function"
@@ -115,6 +573,51 @@ class AgentStateResponse:
     hlp: Optional[HLPResponse] = None
     current_task: Optional[CurrentTaskResponse] = None
 
+_agent_state_adapter = TypeAdapter(AgentStateResponse)
+
+
+class LazyAgentStateResponse(AgentStateResponse):
+    """
+    AgentStateResponse validated from the raw response on first access of its fields -
+    the (potentially large) HLP log is only validated if the agent state is used
+    """
+
+    def __init__(self, raw: Any):
+        object.__setattr__(self, "_raw", raw)
+        object.__setattr__(self, "_parsed", None)
+
+    def parse(self) -> AgentStateResponse:
+        parsed = self._parsed
+        if parsed is None:
+            parsed = _agent_state_adapter.validate_python(self._raw)
+            object.__setattr__(self, "_parsed", parsed)
+        return parsed
+
+    @property
+    def parsed(self) -> bool:
+        """Whether the agent state was validated already"""
+        return self._parsed is not None
+
+    @property
+    def hlp(self) -> Optional[HLPResponse]:
+        return self.parse().hlp
+
+    @property
+    def current_task(self) -> Optional[CurrentTaskResponse]:
+        return self.parse().current_task
+
+    def __eq__(self, other):
+        if isinstance(other, LazyAgentStateResponse):
+            other = other.parse()
+        return self.parse() == other
+
+    def __hash__(self):
+        return hash(self.parse())
+
+    def __repr__(self):
+        return repr(self.parse())
+
+
 # ActionResponse format returned from GAME API call
 class ActionResponse(BaseModel):
     """
@@ -124,3 +627,28 @@ class ActionResponse(BaseModel):
     agent_state: AgentStateResponse
     action_args: Optional[Dict[str, Any]] = None
 
+    @classmethod
+    def from_response(cls, response: Dict[str, Any], strict: bool = False) -> "ActionResponse":
+        """
+        ActionResponse of a GAME API response. Only the action fields are validated up front
+        (the agent state is validated on first access) unless `strict` is set.
+        """
+        if strict:
+            return cls.model_validate(response)
+        try:
+            action_type = ActionType(response["action_type"])
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid action response: {response!r}") from e
+        action_args = response.get("action_args")
+        if action_args is not None and not isinstance(action_args, dict):
+            raise ValueError(f"Invalid action args: {action_args!r}")
+        # only its fields are validated lazily - a missing agent state fails here, as with `strict`
+        agent_state = response.get("agent_state")
+        if not isinstance(agent_state, dict):
+            raise ValueError(f"Invalid agent state: {agent_state!r}")
+        return cls.model_construct(
+            action_type=action_type,
+            agent_state=LazyAgentStateResponse(agent_state),
+            action_args=action_args,
+        )
+
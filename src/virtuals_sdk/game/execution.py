@@ -0,0 +1,195 @@
+"""
+Backends that run function executables:
+
+- `InlineBackend` runs executables on the calling thread (timeouts cannot be enforced)
+- `ThreadBackend` runs them on a thread pool - a timed out executable is abandoned (Python
+  threads cannot be killed), its thread is only freed once the executable returns
+- `ProcessBackend` runs them on worker processes, for CPU-heavy executables - executables
+  and their arguments/results must be picklable (e.g. module-level functions), and the
+  process of a timed out executable is terminated (each executable runs on a process of its own)
+"""
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+
+class ExecutionTimeout(Exception):
+    """Raised when an executable does not finish within its timeout"""
+
+
+class ExecutionBackend(ABC):
+    """
+    Runs executables, returning a future of their result
+    """
+
+    @abstractmethod
+    def submit(self, fn: Callable, kwargs: Dict[str, Any]) -> concurrent.futures.Future:
+        pass
+
+    def cancel(self, future: concurrent.futures.Future):
+        """Cancel an executable that timed out"""
+        future.cancel()
+
+    def shutdown(self):
+        pass
+
+
+class InlineBackend(ExecutionBackend):
+    def submit(self, fn: Callable, kwargs: Dict[str, Any]) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(**kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+class ThreadBackend(ExecutionBackend):
+    def __init__(self, max_workers: int = 32):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="game-executable")
+
+    def submit(self, fn: Callable, kwargs: Dict[str, Any]) -> concurrent.futures.Future:
+        return self._executor.submit(fn, **kwargs)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class ProcessBackend(ExecutionBackend):
+    """
+    Runs every executable on a worker process of its own (a single-process pool), so a timed out
+    executable is terminated without affecting the others. At most `max_workers` executables run
+    at once (others wait for a worker), and idle workers are reused.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, mp_context=None):
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._mp_context = mp_context or multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._idle: List[Any] = []
+        # future -> worker of the executables running
+        self._running: Dict[concurrent.futures.Future, Any] = {}
+        self._pending: Deque[Tuple[concurrent.futures.Future, Callable, Dict[str, Any]]] = collections.deque()
+        self._closed = False
+
+    def submit(self, fn: Callable, kwargs: Dict[str, Any]) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Cannot submit to a backend that was shut down")
+            if len(self._running) >= self._max_workers:
+                self._pending.append((future, fn, kwargs))
+                return future
+            worker = self._acquire_worker()
+            self._running[future] = worker
+        self._start(future, worker, fn, kwargs)
+        return future
+
+    def _acquire_worker(self):
+        # called with the lock held
+        return self._idle.pop() if self._idle else self._mp_context.Pool(processes=1)
+
+    def _start(self, future: concurrent.futures.Future, worker, fn: Callable, kwargs: Dict[str, Any]):
+        if not future.set_running_or_notify_cancel():
+            self._release(future, worker)
+            return
+
+        def on_result(result):
+            if self._release(future, worker):
+                future.set_result(result)
+
+        def on_error(error):
+            if self._release(future, worker):
+                future.set_exception(error)
+
+        worker.apply_async(fn, kwds=kwargs, callback=on_result, error_callback=on_error)
+
+    def _release(self, future: concurrent.futures.Future, worker) -> bool:
+        """Free the worker of a finished executable (False if it was cancelled and terminated)"""
+        with self._lock:
+            if self._running.pop(future, None) is None:
+                return False
+            next_call = self._pending.popleft() if self._pending and not self._closed else None
+            if next_call is not None:
+                self._running[next_call[0]] = worker
+            elif self._closed or len(self._idle) >= self._max_workers:
+                # the process exits once its work is done (terminating it from its own result thread would deadlock)
+                worker.close()
+            else:
+                self._idle.append(worker)
+        if next_call is not None:
+            self._start(next_call[0], worker, next_call[1], next_call[2])
+        return True
+
+    def cancel(self, future: concurrent.futures.Future):
+        if future.cancel():
+            # was waiting for a worker
+            return
+        with self._lock:
+            worker = self._running.pop(future, None)
+            if worker is not None:
+                # the freed slot goes to the next waiting executable, on a new worker
+                next_call = self._pending.popleft() if self._pending and not self._closed else None
+                if next_call is not None:
+                    next_worker = self._acquire_worker()
+                    self._running[next_call[0]] = next_worker
+        if worker is None:
+            return
+        worker.terminate()
+        if next_call is not None:
+            self._start(next_call[0], next_worker, next_call[1], next_call[2])
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            pending, self._pending = list(self._pending), collections.deque()
+        for future, _, _ in pending:
+            future.cancel()
+        for worker in idle:
+            worker.close()
+
+
+INLINE_BACKEND = InlineBackend()
+
+_default_backends: Dict[str, ExecutionBackend] = {"inline": INLINE_BACKEND}
+_default_backends_lock = threading.Lock()
+_backend_types = {"thread": ThreadBackend, "process": ProcessBackend}
+
+
+def get_backend(backend: Union[str, ExecutionBackend, None] = None) -> ExecutionBackend:
+    """
+    Backend instance for a backend name ("inline", "thread" or "process" - shared by all
+    functions using the name), or the given backend. Defaults to the thread backend.
+    """
+    if isinstance(backend, ExecutionBackend):
+        return backend
+    name = backend or "thread"
+    with _default_backends_lock:
+        if name not in _default_backends:
+            if name not in _backend_types:
+                raise ValueError(f"Unknown execution backend: {name}")
+            _default_backends[name] = _backend_types[name]()
+        return _default_backends[name]
+
+
+def run_executable(fn: Callable, kwargs: Dict[str, Any], timeout: Optional[float] = None,
+                   backend: Union[str, ExecutionBackend, None] = None) -> Any:
+    """
+    Run an executable on a backend, raising ExecutionTimeout if it does not finish within `timeout` seconds
+    """
+    backend = get_backend(backend)
+    future = backend.submit(fn, kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        if future.done():
+            # raised by the executable itself
+            raise
+        backend.cancel(future)
+        raise ExecutionTimeout(f"Timed out after {timeout}s")
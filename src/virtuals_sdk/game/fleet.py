@@ -0,0 +1,309 @@
+import asyncio
+import collections
+import concurrent.futures
+import heapq
+import itertools
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+from virtuals_sdk.game.agent import Agent
+from virtuals_sdk.game.async_agent import AsyncAgent
+from virtuals_sdk.transport import AsyncHTTPTransport, HTTPTransport
+
+
+def _percentile(values: List[float], q: float) -> float:
+    index = min(len(values) - 1, int(q / 100 * len(values)))
+    return values[index]
+
+
+class _FleetMember:
+    __slots__ = (
+        "name", "agent", "interval", "max_steps", "max_consecutive_errors",
+        "steps", "errors", "consecutive_errors", "step_time", "last_error", "stopped",
+    )
+
+    def __init__(self, name: str, agent: Union[Agent, AsyncAgent], interval: float,
+                 max_steps: Optional[int], max_consecutive_errors: Optional[int]):
+        self.name = name
+        self.agent = agent
+        self.interval = interval
+        self.max_steps = max_steps
+        self.max_consecutive_errors = max_consecutive_errors
+        self.steps = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.step_time = 0.0
+        self.last_error: Optional[BaseException] = None
+        self.stopped = False
+
+    @property
+    def done(self) -> bool:
+        return self.stopped or (self.max_steps is not None and self.steps >= self.max_steps)
+
+
+class AgentFleet:
+    """
+    Runs the steps of many agents from a single event loop.
+
+    Steps of `AsyncAgent`s run on the event loop, steps of (sync) `Agent`s on a thread pool
+    bounded by `max_concurrent_steps` - so the number of threads does not grow with the
+    number of agents. Agents are stepped when due (every `interval` seconds, measured from the
+    end of their previous step), at most one step per agent at a time; when more agents are due
+    than steps may run, the ones that have waited longest go first.
+
+    Agents share the fleet's `transport` (pass it when creating them - `fleet.transport` for
+    AsyncAgents, `fleet.transport.transport` for Agents) and, as all clients, the
+    process-wide access token cache.
+
+        fleet = AgentFleet(max_concurrent_steps=50)
+        for i in range(200):
+            fleet.add(AsyncAgent(..., transport=fleet.transport, verbose=False), interval=30)
+        asyncio.run(fleet.run())
+    """
+
+    def __init__(
+        self,
+        max_concurrent_steps: int = 10,
+        transport: Optional[AsyncHTTPTransport] = None,
+        error_backoff: float = 5.0,
+        on_error: Optional[Callable[[str, BaseException], Any]] = None,
+        latency_window: int = 1000,
+    ):
+        """
+        Args:
+            max_concurrent_steps: steps running at the same time (across all agents)
+            transport: transport shared by the agents of the fleet (defaults to a transport
+                with a connection pool sized for `max_concurrent_steps`)
+            error_backoff: minimum seconds before an agent is stepped again after a failed step
+            on_error: called with the agent name and the exception of every failed step
+            latency_window: number of recent steps the latency percentiles are computed from
+        """
+        self.max_concurrent_steps = max_concurrent_steps
+        self.transport: AsyncHTTPTransport = transport or AsyncHTTPTransport(
+            HTTPTransport(pool_maxsize=max_concurrent_steps), max_workers=max_concurrent_steps)
+        self.error_backoff = error_backoff
+        self.on_error = on_error
+
+        self._members: Dict[str, _FleetMember] = {}
+        # (due time, order, name) of the agents waiting for their next step
+        self._queue: List[Tuple[float, int, str]] = []
+        self._order = itertools.count()
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # steps (and compilations of agents added while running) in progress
+        self._tasks = set()
+        self._stopped = False
+
+        self._latencies: Deque[float] = collections.deque(maxlen=latency_window)
+        self._lags: Deque[float] = collections.deque(maxlen=latency_window)
+        self._steps = 0
+        self._errors = 0
+        self._in_flight = 0
+        self._started_at: Optional[float] = None
+
+    def add(self, agent: Union[Agent, AsyncAgent], interval: float = 0.0, name: Optional[str] = None,
+            max_steps: Optional[int] = None, max_consecutive_errors: Optional[int] = None) -> str:
+        """
+        Add an agent to the fleet (it is compiled when the fleet starts, unless it already is)
+
+        Args:
+            agent: the agent
+            interval: seconds between the end of a step and the start of the next one
+            name: name of the agent in the fleet and its stats (defaults to the agent name)
+            max_steps: number of successful steps after which the agent is done (None to run forever)
+            max_consecutive_errors: failed steps in a row after which the agent is stopped
+                (None to keep retrying)
+
+        Returns:
+            the name of the agent in the fleet
+        """
+        name = name or agent.name
+        if name in self._members:
+            raise ValueError(f"Agent already in the fleet: {name}")
+        self._members[name] = _FleetMember(name, agent, interval, max_steps, max_consecutive_errors)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._schedule_new, name)
+        return name
+
+    def remove(self, name: str):
+        """Stop stepping an agent and remove it from the fleet"""
+        member = self._members.pop(name)
+        member.stopped = True
+
+    def stop(self):
+        """Stop the fleet - steps in progress are completed (can be called from any thread)"""
+        self._stopped = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _push(self, name: str, due: float):
+        heapq.heappush(self._queue, (due, next(self._order), name))
+        self._wakeup.set()
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Future):
+        self._tasks.discard(task)
+        # the scheduler may be waiting for the last tasks to finish
+        self._wakeup.set()
+
+    def _schedule_new(self, name: str):
+        self._spawn(self._start_member(name))
+
+    async def _start_member(self, name: str):
+        member = self._members.get(name)
+        if member is None:
+            return
+        try:
+            await self._compile(member.agent)
+        except Exception as e:
+            self._record_error(member, e)
+            member.stopped = True
+            return
+        self._push(name, self._loop.time())
+
+    async def _compile(self, agent: Union[Agent, AsyncAgent]):
+        if getattr(agent, "_map_id", None) is not None:
+            return
+        if isinstance(agent, AsyncAgent):
+            await agent.compile()
+        else:
+            await self._loop.run_in_executor(self._executor, agent.compile)
+
+    def _record_error(self, member: _FleetMember, error: BaseException):
+        self._errors += 1
+        member.errors += 1
+        member.consecutive_errors += 1
+        member.last_error = error
+        if self.on_error is not None:
+            self.on_error(member.name, error)
+
+    async def _step(self, member: _FleetMember, due: float):
+        start = self._loop.time()
+        self._lags.append(start - due)
+        try:
+            if isinstance(member.agent, AsyncAgent):
+                await member.agent.step()
+            else:
+                await self._loop.run_in_executor(self._executor, member.agent.step)
+        except Exception as e:
+            failed = True
+            self._record_error(member, e)
+        else:
+            failed = False
+            member.consecutive_errors = 0
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+        elapsed = self._loop.time() - start
+        self._steps += 1
+        self._latencies.append(elapsed)
+        if not failed:
+            # failed steps count as errors, not towards max_steps
+            member.steps += 1
+            member.step_time += elapsed
+
+        if (
+            member.max_consecutive_errors is not None
+            and member.consecutive_errors >= member.max_consecutive_errors
+        ):
+            member.stopped = True
+        if not member.done and member.name in self._members:
+            delay = max(member.interval, self.error_backoff) if failed else member.interval
+            self._push(member.name, self._loop.time() + delay)
+
+    async def _wait(self, timeout: Optional[float]):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def run(self, duration: Optional[float] = None):
+        """
+        Step the agents until the fleet is stopped, all agents are done, or for `duration` seconds
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_steps)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_concurrent_steps, thread_name_prefix="game-fleet")
+        self._stopped = False
+        self._started_at = time.monotonic()
+        deadline = self._loop.time() + duration if duration is not None else None
+
+        try:
+            await asyncio.gather(*(self._start_member(name) for name in list(self._members)))
+            while not self._stopped:
+                now = self._loop.time()
+                if deadline is not None and now >= deadline:
+                    break
+                if not self._queue:
+                    if not self._tasks:
+                        # every agent is done
+                        break
+                    await self._wait(None if deadline is None else deadline - now)
+                    continue
+
+                due, _, name = self._queue[0]
+                if due > now:
+                    timeout = due - now if deadline is None else min(due, deadline) - now
+                    await self._wait(timeout)
+                    continue
+
+                await self._semaphore.acquire()
+                if self._stopped or not self._queue or self._queue[0][0] > self._loop.time():
+                    self._semaphore.release()
+                    continue
+                due, _, name = heapq.heappop(self._queue)
+                member = self._members.get(name)
+                if member is None or member.done:
+                    self._semaphore.release()
+                    continue
+
+                self._in_flight += 1
+                self._spawn(self._step(member, due))
+        finally:
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._queue.clear()
+            self._executor.shutdown(wait=False)
+            self._loop = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Fleet-wide throughput and step latency (seconds) and per-agent counts
+        """
+        elapsed = time.monotonic() - self._started_at if self._started_at is not None else 0.0
+        latencies = sorted(self._latencies)
+        lags = list(self._lags)
+        stats: Dict[str, Any] = {
+            "agents": len(self._members),
+            "steps": self._steps,
+            "errors": self._errors,
+            "in_flight": self._in_flight,
+            "steps_per_sec": self._steps / elapsed if elapsed else 0.0,
+            # seconds steps started after they were due (e.g. waiting for a free slot)
+            "schedule_lag_mean": sum(lags) / len(lags) if lags else 0.0,
+            "agents_stats": {
+                name: {
+                    "steps": member.steps,
+                    "errors": member.errors,
+                    "mean_step_time": member.step_time / member.steps if member.steps else 0.0,
+                    "done": member.done,
+                    "last_error": repr(member.last_error) if member.last_error is not None else None,
+                }
+                for name, member in self._members.items()
+            },
+        }
+        if latencies:
+            stats["latency_mean"] = sum(latencies) / len(latencies)
+            stats["latency_p50"] = _percentile(latencies, 50)
+            stats["latency_p95"] = _percentile(latencies, 95)
+            stats["latency_p99"] = _percentile(latencies, 99)
+        return stats
@@ -0,0 +1,160 @@
+import collections
+import json
+import threading
+import time
+from typing import Any, Deque, Dict, IO, Iterator, List, Optional
+from virtuals_sdk.game.observers import StepInfo
+
+
+class StepRecord:
+    """
+    Compact record of one step of an agent
+    """
+    __slots__ = (
+        "step", "time", "session_id", "worker_id", "action_type", "fn_name", "action_status",
+        "duration", "timings",
+    )
+
+    def __init__(self, step: int, time: float, session_id: Optional[str], worker_id: Optional[str],
+                 action_type: str, fn_name: Optional[str] = None, action_status: Optional[str] = None,
+                 duration: float = 0.0, timings: Optional[Dict[str, float]] = None):
+        self.step = step  # number of the step in the history (counting evicted steps)
+        self.time = time  # unix time the step ended
+        self.session_id = session_id
+        self.worker_id = worker_id  # worker the agent was at
+        self.action_type = action_type
+        self.fn_name = fn_name
+        self.action_status = action_status
+        self.duration = duration  # seconds
+        self.timings = timings  # seconds per phase (see observers.PHASE_*)
+
+    @classmethod
+    def from_step_info(cls, step: int, info: StepInfo, session_id: Optional[str] = None) -> "StepRecord":
+        return cls(
+            step=step,
+            time=time.time(),
+            session_id=session_id,
+            worker_id=info.location,
+            action_type=info.action_type.value,
+            fn_name=info.fn_name,
+            action_status=info.action_status.value if info.action_status is not None else None,
+            duration=info.duration,
+            timings=info.timings or None,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StepRecord":
+        return cls(**{name: data.get(name) for name in cls.__slots__})
+
+    def __repr__(self):
+        return (f"StepRecord(step={self.step}, action_type={self.action_type!r}, fn_name={self.fn_name!r}, "
+                f"action_status={self.action_status!r}, worker_id={self.worker_id!r}, duration={self.duration:.4f})")
+
+
+def _percentile(values: List[float], q: float) -> float:
+    index = min(len(values) - 1, int(q / 100 * len(values)))
+    return values[index]
+
+
+class StepHistory:
+    """
+    History of the last `capacity` steps of an agent (older steps are evicted, so memory
+    stays bounded however long the agent runs). Every step can also be appended to a
+    JSONL file (`spill_path`), which keeps the full trajectory on disk.
+    """
+
+    def __init__(self, capacity: int = 100, spill_path: Optional[str] = None):
+        if capacity < 1:
+            raise ValueError("History capacity must be at least 1")
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self._records: Deque[StepRecord] = collections.deque(maxlen=capacity)
+        # steps recorded since the history was created (including evicted ones)
+        self.total_steps = 0
+        self._spill_file: Optional[IO[str]] = None
+        self._lock = threading.Lock()
+
+    def append(self, info: StepInfo, session_id: Optional[str] = None) -> StepRecord:
+        """Record a step"""
+        with self._lock:
+            record = StepRecord.from_step_info(self.total_steps, info, session_id)
+            self.total_steps += 1
+            self._records.append(record)
+            if self.spill_path is not None:
+                if self._spill_file is None:
+                    self._spill_file = open(self.spill_path, "a")
+                self._spill_file.write(json.dumps(record.to_dict(), separators=(",", ":")) + "\n")
+                self._spill_file.flush()
+        return record
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[StepRecord]:
+        with self._lock:
+            return iter(list(self._records))
+
+    def records(
+        self,
+        action_type: Optional[str] = None,
+        fn_name: Optional[str] = None,
+        action_status: Optional[str] = None,
+        worker_id: Optional[str] = None,
+        last: Optional[int] = None,
+    ) -> List[StepRecord]:
+        """
+        Recorded steps (oldest first) matching all of the given filters, optionally only the `last` n of them
+        """
+        records = [
+            record for record in self
+            if (action_type is None or record.action_type == action_type)
+            and (fn_name is None or record.fn_name == fn_name)
+            and (action_status is None or record.action_status == action_status)
+            and (worker_id is None or record.worker_id == worker_id)
+        ]
+        if last is not None:
+            records = records[-last:] if last > 0 else []
+        return records
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Counts and step durations of the recorded steps - e.g. for metrics
+        """
+        records = list(self)
+        durations = sorted(record.duration for record in records)
+        summary: Dict[str, Any] = {
+            "total_steps": self.total_steps,
+            "recorded_steps": len(records),
+            "action_types": dict(collections.Counter(record.action_type for record in records)),
+            "functions": dict(collections.Counter(record.fn_name for record in records if record.fn_name)),
+            "action_statuses": dict(collections.Counter(
+                record.action_status for record in records if record.action_status)),
+        }
+        if durations:
+            summary["duration_mean"] = sum(durations) / len(durations)
+            summary["duration_p50"] = _percentile(durations, 50)
+            summary["duration_p95"] = _percentile(durations, 95)
+        return summary
+
+    def clear(self):
+        """Forget the recorded steps (the spill file is kept)"""
+        with self._lock:
+            self._records.clear()
+
+    def close(self):
+        """Close the spill file"""
+        with self._lock:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+
+
+def load_history(path: str) -> List[StepRecord]:
+    """
+    Load the steps spilled to a file by a StepHistory
+    """
+    with open(path) as f:
+        return [StepRecord.from_dict(json.loads(line)) for line in f if line.strip()]
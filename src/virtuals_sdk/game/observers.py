@@ -0,0 +1,200 @@
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from virtuals_sdk.game.custom_types import (
+    ActionResponse, ActionType, FunctionResult, FunctionResultStatus, LazyAgentStateResponse,
+)
+
+# phases of a step timed for observers (seconds spent in each are reported in StepInfo.timings)
+PHASE_PAYLOAD = "payload"  # building the request payload (including state diffs)
+PHASE_TOKEN = "token"  # getting the access token (usually from the cache)
+PHASE_SERIALIZE = "serialize"  # serializing the request body
+PHASE_NETWORK = "network"  # sending the request and receiving the response (all attempts)
+PHASE_RETRY_WAIT = "retry_wait"  # backing off between attempts
+PHASE_VALIDATE = "validate"  # validating the response into an ActionResponse
+PHASE_EXECUTE = "execute"  # running the selected function
+PHASE_STATE = "state_fn"  # running the state functions
+
+
+class StepTimer:
+    """
+    Accumulates the time spent in each phase of a step:
+
+        start = timer.start()
+        ...
+        timer.stop(PHASE_EXECUTE, start)
+    """
+    __slots__ = ("timings", "start_time")
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.start_time = time.perf_counter()
+
+    def start(self) -> float:
+        return time.perf_counter()
+
+    def stop(self, phase: str, start: float):
+        self.timings[phase] = self.timings.get(phase, 0.0) + time.perf_counter() - start
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start_time
+
+
+class _NullStepTimer(StepTimer):
+    """Timer used when nothing observes the steps - times nothing"""
+    __slots__ = ()
+
+    def __init__(self):
+        self.timings = {}
+        self.start_time = 0.0
+
+    def start(self) -> float:
+        return 0.0
+
+    def stop(self, phase: str, start: float):
+        pass
+
+    def elapsed(self) -> float:
+        return 0.0
+
+
+NULL_STEP_TIMER = _NullStepTimer()
+
+
+class DurationStepTimer(StepTimer):
+    """Timer of steps that are recorded but not observed - only times the whole step, not its phases"""
+    __slots__ = ()
+
+    def start(self) -> float:
+        return 0.0
+
+    def stop(self, phase: str, start: float):
+        pass
+
+
+@dataclass
+class StepInfo:
+    """
+    What happened in one step of an agent or worker
+    """
+    action_type: ActionType
+    # seconds taken by the whole step, and by each of its phases (see the PHASE_* constants)
+    duration: float
+    timings: Dict[str, float] = field(default_factory=dict)
+    agent_id: Optional[str] = None
+    # worker the agent was at when the step was taken (None for standalone workers)
+    location: Optional[str] = None
+    # task of standalone workers
+    submission_id: Optional[str] = None
+    # task of the agent state (None if the state was not parsed, see build_step_info)
+    current_task: Optional[str] = None
+    fn_name: Optional[str] = None
+    fn_id: Optional[str] = None
+    action_status: Optional[FunctionResultStatus] = None
+
+
+def build_step_info(action_response: ActionResponse, timer: StepTimer,
+                    function_result: Optional[FunctionResult] = None, parse_state: bool = True,
+                    **kwargs) -> StepInfo:
+    """
+    StepInfo of a step that got `action_response` (and executed a function with `function_result`).
+    Without `parse_state`, the current task is only read if the agent state was already parsed.
+    """
+    action_args = action_response.action_args or {}
+    agent_state = action_response.agent_state
+    current_task = None
+    if parse_state or not isinstance(agent_state, LazyAgentStateResponse) or agent_state.parsed:
+        task = agent_state.current_task
+        current_task = task.task if task is not None else None
+    return StepInfo(
+        action_type=action_response.action_type,
+        duration=timer.elapsed(),
+        timings=timer.timings,
+        current_task=current_task,
+        fn_name=action_args.get("fn_name"),
+        fn_id=action_args.get("fn_id"),
+        action_status=function_result.action_status if function_result is not None else None,
+        **kwargs,
+    )
+
+
+class StepObserver:
+    """
+    Receives what happens during the steps of agents and workers - subclass it and override
+    the hooks of interest (all of them do nothing by default)
+    """
+
+    def on_action(self, action_response: ActionResponse):
+        """Called with the action selected by GAME"""
+
+    def on_function_result(self, function_result: FunctionResult):
+        """Called with the result of the function executed for the action"""
+
+    def on_message(self, message: str):
+        """Called with notable events of a step (e.g. a new task being generated)"""
+
+    def on_step(self, step: StepInfo):
+        """Called at the end of every step, with its timings and action metadata"""
+
+
+class PrintObserver(StepObserver):
+    """
+    Prints the progress of agents and workers (the `verbose=True` output)
+    """
+
+    def on_action(self, action_response: ActionResponse):
+        print("#" * 50)
+        print("STEP")
+        print(f"Current Task: {action_response.agent_state.current_task}")
+        print(f"Action response: {action_response}")
+        print(f"Action type: {action_response.action_type}")
+
+        # if new task is updated/generated
+        if (
+            action_response.agent_state.hlp
+            and action_response.agent_state.hlp.change_indicator
+        ):
+            print("New task generated")
+            print(f"Task: {action_response.agent_state.current_task}")
+
+    def on_function_result(self, function_result: FunctionResult):
+        print(f"Function result: {function_result}")
+
+    def on_message(self, message: str):
+        print(message)
+
+
+class ObserverGroup(StepObserver):
+    """
+    Forwards every hook to several observers
+    """
+
+    def __init__(self, observers: List[StepObserver]):
+        self.observers = list(observers)
+
+    def on_action(self, action_response: ActionResponse):
+        for observer in self.observers:
+            observer.on_action(action_response)
+
+    def on_function_result(self, function_result: FunctionResult):
+        for observer in self.observers:
+            observer.on_function_result(function_result)
+
+    def on_message(self, message: str):
+        for observer in self.observers:
+            observer.on_message(message)
+
+    def on_step(self, step: StepInfo):
+        for observer in self.observers:
+            observer.on_step(step)
+
+
+def get_observer(observer: Optional[StepObserver], verbose: bool) -> Optional[StepObserver]:
+    """
+    Observer of an agent or worker - None when nothing observes it (the phases of steps are then not timed)
+    """
+    if not verbose:
+        return observer
+    if observer is None:
+        return PrintObserver()
+    return ObserverGroup([PrintObserver(), observer])
@@ -0,0 +1,38 @@
+from typing import Optional
+from virtuals_sdk.game.custom_types import ActionType
+
+
+class Pacing:
+    """
+    Pace of an agent's run loop: a step every `heartbeat` seconds, backing off exponentially
+    (from `wait_backoff` up to `max_wait_backoff` seconds) while GAME keeps answering WAIT.
+    Pushing an event to the agent (`agent.notify`) wakes it up immediately and resets the backoff.
+    """
+
+    def __init__(self, heartbeat: float = 0.0, wait_backoff: float = 5.0, max_wait_backoff: float = 300.0,
+                 backoff_factor: float = 2.0):
+        """
+        Args:
+            heartbeat: seconds between the end of a step and the start of the next one
+            wait_backoff: seconds to wait after the first WAIT in a row (at least `heartbeat`)
+            max_wait_backoff: maximum seconds to wait after consecutive WAITs
+            backoff_factor: factor the wait grows by with every consecutive WAIT
+        """
+        self.heartbeat = heartbeat
+        self.wait_backoff = wait_backoff
+        self.max_wait_backoff = max_wait_backoff
+        self.backoff_factor = backoff_factor
+        self.consecutive_waits = 0
+
+    def next_delay(self, action_type: Optional[ActionType]) -> float:
+        """Seconds to wait before the next step, after a step that got `action_type`"""
+        if action_type != ActionType.WAIT:
+            self.consecutive_waits = 0
+            return self.heartbeat
+        self.consecutive_waits += 1
+        backoff = self.wait_backoff * self.backoff_factor ** (self.consecutive_waits - 1)
+        return max(self.heartbeat, min(backoff, self.max_wait_backoff))
+
+    def reset(self):
+        """Stop backing off (e.g. an event arrived)"""
+        self.consecutive_waits = 0
@@ -0,0 +1,155 @@
+"""
+Caches of provisioned GAME resources (agent and map ids), so restarted processes can reuse
+them instead of creating them again. Entries are keyed by a hash of the configuration they
+were created with (see `provisioning_key`), so a changed configuration is provisioned again.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Union
+
+
+def provisioning_key(kind: str, api_key: str, base_url: str, **config: Any) -> str:
+    """
+    Key of a resource of `kind` ("agent", "map") provisioned with `config`.
+    The API key is only included as a hash, so it can not be recovered from the key.
+    """
+    content = json.dumps({
+        "kind": kind,
+        "api_key": hashlib.sha256(api_key.encode("utf-8")).hexdigest(),
+        "base_url": base_url,
+        "config": config,
+    }, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ProvisioningCache(ABC):
+    """
+    Maps provisioning keys to the ids of the provisioned resources
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def put(self, key: str, resource_id: str):
+        pass
+
+    @abstractmethod
+    def invalidate(self, key: str):
+        pass
+
+
+class FileProvisioningCache(ProvisioningCache):
+    """
+    Provisioning cache stored in a JSON file (rewritten atomically, and synced to disk, on every change)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except ValueError:
+                # corrupted file - everything is provisioned again
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".provisioning-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._entries, f, indent=2)
+                # on disk before the rename, so a crash can not leave an empty file
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._load().get(key)
+        return entry["id"] if entry else None
+
+    def put(self, key: str, resource_id: str):
+        with self._lock:
+            self._load()[key] = {"id": resource_id, "created": time.time()}
+            self._save()
+
+    def invalidate(self, key: str):
+        with self._lock:
+            if self._load().pop(key, None) is not None:
+                self._save()
+
+
+class SQLiteProvisioningCache(ProvisioningCache):
+    """
+    Provisioning cache stored in a SQLite database (can be shared by several processes)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # the table is created on first use, so creating the cache does no I/O
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS provisioning (key TEXT PRIMARY KEY, id TEXT NOT NULL, created REAL)")
+            self._initialized = True
+        return connection
+
+    def get(self, key: str) -> Optional[str]:
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT id FROM provisioning WHERE key = ?", (key,)).fetchone()
+        finally:
+            connection.close()
+        return row[0] if row else None
+
+    def put(self, key: str, resource_id: str):
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO provisioning (key, id, created) VALUES (?, ?, ?)",
+                    (key, resource_id, time.time()))
+        finally:
+            connection.close()
+
+    def invalidate(self, key: str):
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("DELETE FROM provisioning WHERE key = ?", (key,))
+        finally:
+            connection.close()
+
+
+def get_provisioning_cache(cache: Union[str, ProvisioningCache, None]) -> Optional[ProvisioningCache]:
+    """
+    Provisioning cache for a path (SQLite for `.db`/`.sqlite`/`.sqlite3` files, JSON otherwise)
+    """
+    if cache is None or isinstance(cache, ProvisioningCache):
+        return cache
+    if os.path.splitext(cache)[1].lower() in (".db", ".sqlite", ".sqlite3"):
+        return SQLiteProvisioningCache(cache)
+    return FileProvisioningCache(cache)
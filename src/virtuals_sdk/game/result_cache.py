@@ -0,0 +1,94 @@
+import collections
+import json
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# (function name, scope, arguments)
+CacheKey = Tuple[str, str, str]
+
+
+class ResultCache:
+    """
+    In-process LRU cache of function results, with a time to live per entry.
+
+    Entries are keyed by function name, scope and arguments (see `key`). Functions use their
+    executable as scope, so functions with the same name but different executables (e.g. bound
+    to different wallets) never share results. Results are kept for the `cache_ttl` of their
+    function, and the least recently used ones are evicted beyond `max_size` entries.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        # key -> (expiry time, result)
+        self._entries: "collections.OrderedDict[CacheKey, Tuple[float, Any]]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = collections.defaultdict(int)
+        self._misses: Dict[str, int] = collections.defaultdict(int)
+        self.evictions = 0
+
+    @staticmethod
+    def key(fn_name: str, args: Dict[str, Any], scope: str = "") -> CacheKey:
+        """Key of a call - arguments are normalized (key order does not matter)"""
+        return fn_name, scope, json.dumps(args, sort_keys=True, separators=(",", ":"), default=repr)
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        """Cached result of a call (None if there is none or it expired)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._misses[key[0]] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits[key[0]] += 1
+            return entry[1]
+
+    def put(self, key: CacheKey, result: Any, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, fn_name: str, args: Optional[Dict[str, Any]] = None, scope: Optional[str] = None):
+        """
+        Drop the cached results of a function (or only of the call with `args`) - of all scopes,
+        or only of `scope`
+        """
+        with self._lock:
+            if args is not None and scope is not None:
+                self._entries.pop(self.key(fn_name, args, scope), None)
+                return
+            args_key = self.key(fn_name, args)[2] if args is not None else None
+            for key in [
+                key for key in self._entries
+                if key[0] == fn_name and (scope is None or key[1] == scope) and (args_key is None or key[2] == args_key)
+            ]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self, fn_name: Optional[str] = None) -> Dict[str, int]:
+        """Hits, misses and size of the cache (or hits and misses of one function)"""
+        with self._lock:
+            if fn_name is not None:
+                return {"hits": self._hits.get(fn_name, 0), "misses": self._misses.get(fn_name, 0)}
+            return {
+                "hits": sum(self._hits.values()),
+                "misses": sum(self._misses.values()),
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# cache of the functions that do not have their own
+default_result_cache = ResultCache()
@@ -0,0 +1,164 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Collection, Optional
+import requests
+import urllib3
+
+
+class RetryBudget:
+    """
+    Process-wide budget that throttles retries when the backend is degraded.
+
+    Token bucket in the style of gRPC retry throttling: every retryable failure takes one
+    token, every successful request gives back `token_ratio` tokens, and retries are only
+    allowed while more than half of `max_tokens` are left. When most requests fail the
+    bucket drains and clients stop retrying instead of multiplying the load on the backend.
+    """
+
+    def __init__(self, max_tokens: float = 100.0, token_ratio: float = 0.1):
+        self.max_tokens = max_tokens
+        self.token_ratio = token_ratio
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+    def record_success(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.token_ratio)
+
+    def record_failure(self):
+        with self._lock:
+            self._tokens = max(0.0, self._tokens - 1)
+
+    def can_retry(self) -> bool:
+        return self._tokens > self.max_tokens / 2
+
+
+# retry budget shared by all agents and workers in the process
+default_retry_budget = RetryBudget()
+
+
+class RetryPolicy:
+    """
+    When and how long to wait before retrying a failed GAME API call.
+
+    Only failures where the request was not (or cannot have been) processed are retried, as
+    most calls are not idempotent (creating agents, maps and tasks, taking actions): errors
+    connecting to the API (the request was never sent) and the statuses in `retry_statuses`
+    (rate limiting and unavailability). Gateway errors (502, 504) can be returned after the
+    request was processed, so they are only retried if added to `retry_statuses`. Delays grow
+    exponentially from `backoff_base` up to `backoff_max` with full jitter, and a
+    `Retry-After` header sent by the server takes precedence (capped at `max_retry_after`).
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        jitter: bool = True,
+        retry_statuses: Collection[int] = (429, 503),
+        retry_connection_errors: bool = True,
+        respect_retry_after: bool = True,
+        max_retry_after: float = 60.0,
+        budget: Optional[RetryBudget] = default_retry_budget,
+    ):
+        """
+        Args:
+            max_attempts: total number of attempts per call, including the first one
+            backoff_base: delay before the first retry (doubled on every further retry)
+            backoff_max: maximum delay between two attempts
+            jitter: randomize delays in [0, delay] so clients do not retry in lockstep
+            retry_statuses: HTTP statuses that are retried (the request must not have been processed)
+            retry_connection_errors: retry when the connection to the API could not be made
+            respect_retry_after: wait as long as the `Retry-After` header asks (if present)
+            max_retry_after: upper bound on the wait requested through `Retry-After`
+            budget: retry budget shared between callers (None to disable)
+        """
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_connection_errors = retry_connection_errors
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+        self.budget = budget
+
+    def is_retryable_status(self, status_code: int) -> bool:
+        return status_code in self.retry_statuses
+
+    def is_retryable_exception(self, exc: Exception) -> bool:
+        # only errors making the connection mean the request was never sent - a connection
+        # dropped or a read timing out after sending it may come after it was processed
+        return self.retry_connection_errors and _failed_to_connect(exc)
+
+    def should_retry(self, attempt: int) -> bool:
+        """
+        Record a retryable failure of attempt number `attempt` (0-based) and decide whether to retry it
+        """
+        if self.budget is not None:
+            self.budget.record_failure()
+        if attempt + 1 >= self.max_attempts:
+            return False
+        return self.budget is None or self.budget.can_retry()
+
+    def record_success(self):
+        if self.budget is not None:
+            self.budget.record_success()
+
+    def get_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """
+        Seconds to wait before retrying attempt number `attempt` (0-based)
+        """
+        if self.respect_retry_after and response is not None:
+            retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.max_retry_after)
+
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+def _failed_to_connect(exc: Exception) -> bool:
+    """
+    Whether a request failed before it was sent (DNS resolution, connection refused or timed out)
+    """
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(exc, requests.exceptions.ConnectionError):
+        return False
+    # requests wraps the urllib3 error (in a MaxRetryError giving its reason)
+    reason = exc.args[0] if exc.args else None
+    reason = getattr(reason, "reason", reason)
+    return isinstance(reason, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError))
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header (delay in seconds or HTTP date) into seconds from now
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# retry policy used by all agents and workers that were not given one explicitly
+default_retry_policy = RetryPolicy()
+
+# policy that never retries
+NO_RETRY = RetryPolicy(max_attempts=1, budget=None)
@@ -0,0 +1,292 @@
+"""
+Size budgets of the states sent to GAME.
+
+State functions often accumulate (e.g. a list of recent posts that is only ever appended to),
+making every request larger than the previous one. A `StateBudget` limits the size of a state
+as sent to GAME, in bytes of JSON and/or tokens: a state over its budget is compacted by the
+budget's policies, in order, until it fits. Only the state sent is compacted - the state kept
+by the agent or worker (and passed back to its state function) is left as is.
+
+    budget = StateBudget(max_bytes=16_000, policies=[
+        KeepTopK("tweets", 20, key="likes"),
+        SummarizeStrings(max_chars=2000),
+        TruncateOldest(),
+    ])
+    agent = Agent(..., state_budget=budget)
+    budget.stats()  # how many states were compacted, and how much was trimmed
+    budget.stats("twitter_worker")  # the same, for the states of one worker
+"""
+from abc import ABC, abstractmethod
+import heapq
+import json
+import math
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from virtuals_sdk.game.custom_types import RawJSON
+
+
+def _dumps(value: Any) -> str:
+    # as in request payloads (see utils.dumps_payload), so sizes are the sizes sent
+    return json.dumps(value, separators=(",", ":"), allow_nan=False)
+
+
+def _split_path(path: str) -> Tuple[str, ...]:
+    return tuple(path.split(".")) if path else ()
+
+
+def _get_path(state: Any, keys: Sequence[str]) -> Any:
+    for key in keys:
+        if not isinstance(state, dict) or key not in state:
+            return None
+        state = state[key]
+    return state
+
+
+def _replace_path(state: Any, keys: Sequence[str], value: Any) -> Any:
+    """Copy of `state` with the value at `keys` replaced (only the dicts on the path are copied)"""
+    if not keys:
+        return value
+    state = dict(state)
+    state[keys[0]] = _replace_path(state[keys[0]], keys[1:], value)
+    return state
+
+
+def _find_lists(state: Any, keys: Tuple[str, ...] = ()) -> Iterator[Tuple[Tuple[str, ...], list]]:
+    """Paths and values of the lists in the (nested) dicts of a state"""
+    if isinstance(state, dict):
+        for key, value in state.items():
+            yield from _find_lists(value, keys + (key,))
+    elif isinstance(state, list) and keys:
+        yield keys, state
+
+
+class CompactionStats:
+    """What the policies trimmed from one state"""
+    __slots__ = ("items_dropped", "strings_summarized")
+
+    def __init__(self):
+        self.items_dropped = 0
+        self.strings_summarized = 0
+
+
+class CompactionPolicy(ABC):
+    """
+    A way of making states smaller - subclass it and implement `compact`
+    """
+
+    @abstractmethod
+    def compact(self, state: Any, excess: int, stats: CompactionStats) -> Any:
+        """
+        Smaller version of `state`, ideally by at least `excess` bytes (of JSON).
+        `state` must not be modified: containers that change are copied.
+        """
+
+
+class TruncateOldest(CompactionPolicy):
+    """
+    Drops the oldest (first) entries of lists until the state fits its budget.
+
+    Lists are given by their paths (e.g. "posts" or "wallet.transactions") - by default, all lists
+    in the (nested) dicts of the state, largest first. At least `min_items` entries are kept.
+    Dropping entries from the front of a list keeps state diffs small (see game.state_diff).
+    """
+
+    def __init__(self, *paths: str, min_items: int = 0):
+        self.paths = [_split_path(path) for path in paths]
+        self.min_items = min_items
+
+    def compact(self, state: Any, excess: int, stats: CompactionStats) -> Any:
+        if self.paths:
+            lists = [(keys, _get_path(state, keys)) for keys in self.paths]
+            lists = [(keys, value) for keys, value in lists if isinstance(value, list)]
+        else:
+            lists = sorted(_find_lists(state), key=lambda entry: len(_dumps(entry[1])), reverse=True)
+
+        for keys, items in lists:
+            if excess <= 0:
+                break
+            drop, dropped_bytes = 0, 0
+            while dropped_bytes < excess and len(items) - drop > self.min_items:
+                # the entry and its separating comma
+                dropped_bytes += len(_dumps(items[drop])) + 1
+                drop += 1
+            if drop:
+                state = _replace_path(state, keys, items[drop:])
+                stats.items_dropped += drop
+                excess -= dropped_bytes
+        return state
+
+
+class KeepTopK(CompactionPolicy):
+    """
+    Keeps the `k` entries of the list at `path` with the highest `key` (a function of an entry,
+    or the name of a field of dict entries), in their original order. Entries whose key is None
+    (e.g. without the field, or not dicts) are dropped first.
+    """
+
+    def __init__(self, path: str, k: int, key: Union[str, Callable[[Any], Any]]):
+        self.keys = _split_path(path)
+        self.k = k
+        self.key = (lambda item: item.get(key) if isinstance(item, dict) else None) if isinstance(key, str) else key
+
+    def compact(self, state: Any, excess: int, stats: CompactionStats) -> Any:
+        items = _get_path(state, self.keys)
+        if not isinstance(items, list) or len(items) <= self.k:
+            return state
+        kept = sorted(heapq.nlargest(self.k, range(len(items)), key=self._rank(items)))
+        stats.items_dropped += len(items) - len(kept)
+        return _replace_path(state, self.keys, [items[i] for i in kept])
+
+    def _rank(self, items: list) -> Callable[[int], Tuple[bool, Any]]:
+        # missing keys rank below all others (and are never compared with them)
+        def rank(i: int) -> Tuple[bool, Any]:
+            value = self.key(items[i])
+            return (True, value) if value is not None else (False, 0)
+        return rank
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    return f"{text[:max_chars]}... [{len(text) - max_chars} more characters]"
+
+
+class SummarizeStrings(CompactionPolicy):
+    """
+    Replaces the strings longer than `max_chars` by a summary: `summarize(text)`,
+    or by default the first `max_chars` characters and the number of characters left out
+    """
+
+    def __init__(self, max_chars: int = 1000, summarize: Optional[Callable[[str], str]] = None):
+        self.max_chars = max_chars
+        self.summarize = summarize if summarize is not None else (lambda text: _truncate(text, max_chars))
+
+    def compact(self, state: Any, excess: int, stats: CompactionStats) -> Any:
+        return self._compact(state, stats)
+
+    def _compact(self, value: Any, stats: CompactionStats) -> Any:
+        if isinstance(value, str):
+            if len(value) > self.max_chars:
+                stats.strings_summarized += 1
+                return self.summarize(value)
+            return value
+        if isinstance(value, dict):
+            compacted = {key: self._compact(item, stats) for key, item in value.items()}
+            changed = any(compacted[key] is not item for key, item in value.items())
+            return compacted if changed else value
+        if isinstance(value, list):
+            compacted = [self._compact(item, stats) for item in value]
+            changed = any(new is not old for new, old in zip(compacted, value))
+            return compacted if changed else value
+        return value
+
+
+class StateBudget:
+    """
+    Budget of the size of a state sent to GAME, in bytes of JSON (`max_bytes`) and/or in tokens
+    (`max_tokens`, counted by `count_tokens` - by default estimated as one token per 4 bytes).
+
+    States over the budget are compacted by `policies`, in order, until they fit (by default,
+    long strings are summarized, then the oldest entries of lists are dropped). A state that
+    still does not fit is sent as compacted as it got (see `over_budget` in `stats`).
+
+    A budget can be shared, e.g. by all the workers of an agent: `stats` adds up all of its states,
+    `stats(key)` only those applied with `key` (agents and their workers pass the worker id).
+    """
+
+    def __init__(self,
+                 max_bytes: Optional[int] = None,
+                 max_tokens: Optional[int] = None,
+                 policies: Optional[List[CompactionPolicy]] = None,
+                 count_tokens: Optional[Callable[[str], int]] = None,
+                 ):
+        if max_bytes is None and max_tokens is None:
+            raise ValueError("A state budget needs max_bytes or max_tokens")
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        self.policies: List[CompactionPolicy] = (
+            policies if policies is not None else [SummarizeStrings(), TruncateOldest()])
+        self.count_tokens = count_tokens
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = self._new_stats()
+        self._key_stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def _new_stats() -> Dict[str, int]:
+        return dict.fromkeys((
+            "states", "compacted", "over_budget", "bytes_before", "bytes_trimmed",
+            "items_dropped", "strings_summarized"), 0)
+
+    def excess(self, text: str) -> int:
+        """Bytes of a serialized state over the budget (0 or less if it fits)"""
+        excesses = []
+        if self.max_bytes is not None:
+            excesses.append(len(text) - self.max_bytes)
+        if self.max_tokens is not None:
+            tokens = self.count_tokens(text) if self.count_tokens is not None else math.ceil(len(text) / 4)
+            # converted to bytes at the bytes per token of this state
+            excesses.append(math.ceil((tokens - self.max_tokens) * len(text) / max(tokens, 1)))
+        return max(excesses)
+
+    def apply(self, state: Any, serialize: bool = False, key: Optional[str] = None) -> Any:
+        """
+        The state to send: `state` itself if it fits the budget, or a compacted copy.
+        With `serialize`, the state is returned serialized (as it is serialized to be measured anyway).
+        With `key`, the state is also counted in the stats of `key`.
+        """
+        text = _dumps(state)
+        excess = self.excess(text)
+        size = len(text)
+        if excess <= 0:
+            with self._lock:
+                for counts in self._counts(key):
+                    counts["states"] += 1
+                    counts["bytes_before"] += size
+            return RawJSON(text) if serialize else state
+
+        stats = CompactionStats()
+        for policy in self.policies:
+            state = policy.compact(state, excess, stats)
+            text = _dumps(state)
+            excess = self.excess(text)
+            if excess <= 0:
+                break
+
+        with self._lock:
+            for counts in self._counts(key):
+                counts["states"] += 1
+                counts["compacted"] += 1
+                counts["over_budget"] += excess > 0
+                counts["bytes_before"] += size
+                counts["bytes_trimmed"] += size - len(text)
+                counts["items_dropped"] += stats.items_dropped
+                counts["strings_summarized"] += stats.strings_summarized
+        return RawJSON(text) if serialize else state
+
+    def _counts(self, key: Optional[str]) -> Tuple[Dict[str, int], ...]:
+        # stats to count a state in (with the lock held)
+        if key is None:
+            return (self._stats,)
+        key_stats = self._key_stats.get(key)
+        if key_stats is None:
+            key_stats = self._key_stats[key] = self._new_stats()
+        return self._stats, key_stats
+
+    def stats(self, key: Optional[str] = None) -> Dict[str, int]:
+        """
+        States checked against the budget, how many were compacted (and still over budget after it),
+        their total size before compaction and what was trimmed (bytes, list entries, strings) -
+        of all states, or of the states applied with `key`
+        """
+        with self._lock:
+            if key is None:
+                return dict(self._stats)
+            return dict(self._key_stats.get(key) or self._new_stats())
+
+    def stats_keys(self) -> List[str]:
+        """Keys the states were applied with"""
+        with self._lock:
+            return list(self._key_stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = self._new_stats()
+            self._key_stats = {}
@@ -0,0 +1,195 @@
+"""
+Incremental state updates.
+
+Instead of sending the full state on every step, a state can be sent as a diff against
+the state sent in the previous request of the same session:
+
+    {"<field>_diff": {"base": <seq of previous state>, "seq": <seq of this state>, "ops": <diff>}}
+
+Full states are sent as `{"<field>": <state>, "<field>_seq": <seq>}`. A diff of a dict is
+`{"$set": {key: value}, "$del": [key], "$patch": {key: <diff>}}` (empty parts are left out),
+a diff of a list that only had items dropped from its front and/or appended to its end
+(e.g. a list of recent posts) is `{"$drop": <count>, "$append": [items]}`.
+"""
+import copy
+import json
+from typing import Any, Dict, Optional, Tuple
+
+
+class StateResyncRequired(Exception):
+    """
+    Raised by StateDiffDecoder when a diff does not apply to the state it holds
+    (the sender has to send the full state again)
+    """
+
+
+def _diff_list(old: list, new: list) -> Optional[dict]:
+    """
+    Diff of two lists, if `new` is `old` with items dropped from its front and/or appended to its end
+    """
+    for drop in range(len(old)):
+        kept = len(old) - drop
+        if kept > len(new) or old[drop] != new[0]:
+            continue
+        if old[drop:] == new[:kept]:
+            diff = {}
+            if drop:
+                diff["$drop"] = drop
+            if len(new) > kept:
+                diff["$append"] = new[kept:]
+            return diff
+    return None
+
+
+def diff_state(old: dict, new: dict) -> dict:
+    """
+    Diff that turns the `old` state into the `new` state (an empty dict if they are equal)
+    """
+    set_values, patches = {}, {}
+    for key, value in new.items():
+        if key not in old:
+            set_values[key] = value
+            continue
+        old_value = old[key]
+        if old_value == value:
+            continue
+        if isinstance(old_value, dict) and isinstance(value, dict):
+            patches[key] = diff_state(old_value, value)
+        elif isinstance(old_value, list) and isinstance(value, list):
+            list_diff = _diff_list(old_value, value)
+            if list_diff is None:
+                set_values[key] = value
+            else:
+                patches[key] = list_diff
+        else:
+            set_values[key] = value
+
+    diff = {}
+    if set_values:
+        diff["$set"] = set_values
+    deleted = [key for key in old if key not in new]
+    if deleted:
+        diff["$del"] = deleted
+    if patches:
+        diff["$patch"] = patches
+    return diff
+
+
+def apply_state_diff(state: Any, diff: dict) -> Any:
+    """
+    Apply a diff created by `diff_state` to (a copy of) `state` and return the new state
+    """
+    if "$drop" in diff or "$append" in diff:
+        if not isinstance(state, list):
+            raise StateResyncRequired("List diff applied to a value that is not a list")
+        return state[diff.get("$drop", 0):] + list(diff.get("$append", []))
+
+    if not isinstance(state, dict):
+        raise StateResyncRequired("Dict diff applied to a value that is not a dict")
+    new_state = dict(state)
+    for key in diff.get("$del", []):
+        new_state.pop(key, None)
+    new_state.update(diff.get("$set", {}))
+    for key, patch in diff.get("$patch", {}).items():
+        if key not in new_state:
+            raise StateResyncRequired(f"Diff patches missing key: {key}")
+        new_state[key] = apply_state_diff(new_state[key], patch)
+    return new_state
+
+
+def _json_size(value: Any) -> int:
+    return len(json.dumps(value, separators=(",", ":"), allow_nan=False))
+
+
+class StateDiffEncoder:
+    """
+    Encodes the states sent for one field of one session, as diffs against the previously sent state.
+
+    The full state is sent for the first request, every `resync_interval` requests, after
+    `reset()` (e.g. when a request failed) and whenever the diff would not be smaller than
+    the full state.
+    """
+
+    def __init__(self, field: str, resync_interval: int = 50):
+        self.field = field
+        self.resync_interval = resync_interval
+        self._seq = 0
+        # snapshot of the last state sent (None if the next state has to be sent in full)
+        self._last_state: Optional[dict] = None
+        self._since_resync = 0
+
+        # bytes that would have been sent with full states / bytes actually sent
+        self.full_bytes = 0
+        self.sent_bytes = 0
+
+    def reset(self):
+        """Send the full state with the next request."""
+        self._last_state = None
+
+    def encode(self, state: dict) -> Dict[str, Any]:
+        """
+        Payload fields that transmit `state` (to be merged into the request payload)
+        """
+        full_size = _json_size(state)
+        self.full_bytes += full_size
+        self._seq += 1
+
+        fields = None
+        if (
+            self._last_state is not None
+            and isinstance(state, dict)
+            and self._since_resync < self.resync_interval
+        ):
+            diff = {"base": self._seq - 1, "seq": self._seq, "ops": diff_state(self._last_state, state)}
+            diff_size = _json_size(diff)
+            if diff_size < full_size:
+                fields = {f"{self.field}_diff": diff}
+                self.sent_bytes += diff_size
+                self._since_resync += 1
+
+        if fields is None:
+            fields = {self.field: state, f"{self.field}_seq": self._seq}
+            self.sent_bytes += full_size
+            self._since_resync = 0
+
+        # snapshot as the caller may modify the state in place before the next step
+        self._last_state = copy.deepcopy(state)
+        return fields
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.full_bytes - self.sent_bytes
+
+
+class StateDiffDecoder:
+    """
+    Reconstructs the full states from payloads created by StateDiffEncoder (the receiving side)
+    """
+
+    def __init__(self):
+        # (session key, field) -> (seq, state)
+        self._states: Dict[Tuple[str, str], Tuple[int, Any]] = {}
+
+    def decode(self, session_key: str, field: str, payload: dict) -> Any:
+        """
+        Get the full state of `field` from a request payload, updating the stored state of the session
+        """
+        key = (session_key, field)
+        if field in payload:
+            state = payload[field]
+            self._states[key] = (payload.get(f"{field}_seq", 0), state)
+            return state
+
+        diff = payload.get(f"{field}_diff")
+        if diff is None:
+            return None
+        seq, state = self._states.get(key, (None, None))
+        if seq != diff["base"]:
+            raise StateResyncRequired(f"No state {diff['base']} for {field} (have {seq})")
+        state = apply_state_diff(state, diff["ops"])
+        self._states[key] = (diff["seq"], state)
+        return state
+
+    def reset(self):
+        self._states.clear()
+
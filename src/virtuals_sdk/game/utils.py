@@ -1,59 +1,423 @@
+import asyncio
+import base64
+import inspect
+import json
+import threading
+import time
+import uuid
 import requests
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
+from virtuals_sdk.game.custom_types import RawJSON
+from virtuals_sdk.game.observers import (
+    NULL_STEP_TIMER, PHASE_NETWORK, PHASE_RETRY_WAIT, PHASE_SERIALIZE, PHASE_TOKEN, StepTimer,
+)
+from virtuals_sdk.game.retry import RetryPolicy, default_retry_policy
+from virtuals_sdk.transport import (
+    AsyncHTTPTransport,
+    HTTPTransport,
+    get_default_async_transport,
+    get_default_transport,
+)
 
 
-def get_access_token(api_key) -> str:
+# default GAME API endpoints
+DEFAULT_BASE_URL = "https://game.virtuals.io"
+DEFAULT_TOKEN_URL = "https://api.virtuals.io/api/accesses/tokens"
+
+
+def get_access_token(api_key, transport: Optional[HTTPTransport] = None,
+                     token_url: Optional[str] = None,
+                     retry_policy: Optional[RetryPolicy] = None) -> str:
     """
     API call to get access token
+
+    Rate limited, unavailable and unreachable calls are retried according to `retry_policy`
+    (defaults to `retry.default_retry_policy`), as in `post`.
     """
-    response = requests.post(
-        "https://api.virtuals.io/api/accesses/tokens",
-        json={"data": {}},
-        headers={"x-api-key": api_key}
-    )
+    transport = transport or get_default_transport()
+    retry_policy = retry_policy or default_retry_policy
+
+    attempt = 0
+    while True:
+        try:
+            response = transport.post(
+                token_url or DEFAULT_TOKEN_URL,
+                json={"data": {}},
+                headers={"x-api-key": api_key}
+            )
+        except requests.exceptions.RequestException as e:
+            if not retry_policy.is_retryable_exception(e) or not retry_policy.should_retry(attempt):
+                raise
+            time.sleep(retry_policy.get_delay(attempt))
+            attempt += 1
+            continue
+
+        if (
+            retry_policy.is_retryable_status(response.status_code)
+            and retry_policy.should_retry(attempt)
+        ):
+            time.sleep(retry_policy.get_delay(attempt, response))
+            attempt += 1
+            continue
 
-    response_json = response.json()
+        break
+
+    response_json = _response_json(response)
     if response.status_code != 200:
-        raise ValueError(f"Failed to get token: {response_json}")
+        raise GameAPIError(f"Failed to get token: {response_json}", response.status_code, response_json)
 
+    retry_policy.record_success()
     return response_json["data"]["accessToken"]
 
 
-def post(base_url: str, api_key: str, endpoint: str, data: dict) -> dict:
+def _get_token_expiry(access_token: str) -> Optional[float]:
     """
-    API call to post data
+    Read the expiry (unix time) from the `exp` claim of a JWT access token, if present
+    """
+    try:
+        payload = access_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class _CachedToken:
+    __slots__ = ("access_token", "expires_at")
+
+    def __init__(self, access_token: str, expires_at: float):
+        self.access_token = access_token
+        self.expires_at = expires_at
+
+
+class AccessTokenCache:
+    """
+    Caches GAME access tokens per API key so they are reused across requests.
+
+    Tokens are reused until `refresh_margin` seconds before they expire, at which point
+    they are refreshed in a background thread while the still-valid token keeps being
+    served. Only one mint per API key is in flight at any time (single-flight), so
+    concurrent callers do not stampede the token endpoint.
+    """
+
+    def __init__(self, refresh_margin: float = 60.0, default_ttl: float = 300.0):
+        # seconds before expiry at which a background refresh is started
+        self.refresh_margin = refresh_margin
+        # lifetime assumed for tokens that do not carry an `exp` claim
+        self.default_ttl = default_ttl
+
+        # cached tokens by (token url, api key)
+        self._tokens: Dict[Tuple[str, str], _CachedToken] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def _mint(self, key: Tuple[str, str], transport: Optional[HTTPTransport],
+              retry_policy: Optional[RetryPolicy]) -> _CachedToken:
+        token_url, api_key = key
+        access_token = get_access_token(api_key, transport, token_url, retry_policy)
+        expires_at = _get_token_expiry(access_token)
+        if expires_at is None:
+            expires_at = time.time() + self.default_ttl
+        entry = _CachedToken(access_token, expires_at)
+        self._tokens[key] = entry
+        return entry
+
+    def _refresh_in_background(self, key: Tuple[str, str], transport: Optional[HTTPTransport],
+                               retry_policy: Optional[RetryPolicy]):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                with self._key_lock(key):
+                    self._mint(key, transport, retry_policy)
+            except Exception:
+                # the current token is still valid - the next call retries the refresh
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get(self, api_key: str, transport: Optional[HTTPTransport] = None,
+            token_url: Optional[str] = None, retry_policy: Optional[RetryPolicy] = None) -> str:
+        """
+        Get a valid access token for the API key, minting one only if needed
+        (retried according to `retry_policy`, see `get_access_token`)
+        """
+        key = (token_url or DEFAULT_TOKEN_URL, api_key)
+        entry = self._tokens.get(key)
+        now = time.time()
+        if entry is not None and now < entry.expires_at - self.refresh_margin:
+            return entry.access_token
+        if entry is not None and now < entry.expires_at:
+            # token is about to expire - keep serving it while it is refreshed
+            self._refresh_in_background(key, transport, retry_policy)
+            return entry.access_token
+
+        with self._key_lock(key):
+            # another thread may have minted the token while we were waiting
+            entry = self._tokens.get(key)
+            if entry is not None and time.time() < entry.expires_at:
+                return entry.access_token
+            return self._mint(key, transport, retry_policy).access_token
+
+    def invalidate(self, api_key: str, access_token: Optional[str] = None,
+                   token_url: Optional[str] = None):
+        """
+        Drop the cached token for the API key (only if it is still `access_token`, when given)
+        """
+        key = (token_url or DEFAULT_TOKEN_URL, api_key)
+        with self._key_lock(key):
+            entry = self._tokens.get(key)
+            if entry is not None and (access_token is None or entry.access_token == access_token):
+                del self._tokens[key]
+
+    def clear(self):
+        """
+        Drop all cached tokens
+        """
+        self._tokens.clear()
+
+
+# token cache shared by all agents and workers in the process
+default_token_cache = AccessTokenCache()
+
+
+_RAW_JSON_PLACEHOLDER = f"\x00raw-json-{uuid.uuid4().hex}-"
+
+
+def dumps_payload(data: dict) -> str:
+    """
+    Serialize a request payload to JSON. Top-level `RawJSON` values are inserted as is,
+    so parts of the payload that were serialized ahead of time are not serialized again.
+    """
+    raw_values = {}
+    for key, value in data.items():
+        if isinstance(value, RawJSON):
+            # placeholder string to splice the value into once the rest is serialized
+            raw_values[json.dumps(f"{_RAW_JSON_PLACEHOLDER}{len(raw_values)}")] = value
+    if not raw_values:
+        return json.dumps(data, separators=(",", ":"), allow_nan=False)
+
+    placeholders = iter(raw_values)
+    data = {
+        key: json.loads(next(placeholders)) if isinstance(value, RawJSON) else value
+        for key, value in data.items()
+    }
+    serialized = json.dumps(data, separators=(",", ":"), allow_nan=False)
+    for placeholder, value in raw_values.items():
+        serialized = serialized.replace(placeholder, value, 1)
+    return serialized
+
+
+class GameAPIError(ValueError):
+    """
+    A GAME API call failed (HTTP status other than 200)
     """
-    access_token = get_access_token(api_key)
 
-    response = requests.post(
+    def __init__(self, message: str, status_code: int, response_json=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response_json = response_json
+
+
+def _response_json(response: requests.Response):
+    try:
+        return response.json()
+    except ValueError:
+        # e.g. an HTML error page from a gateway
+        return response.text
+
+
+def _post_body(endpoint: str, data: dict) -> bytes:
+    return (
+        '{"data":{"method":"post","headers":{"Content-Type":"application/json"},'
+        f'"route":{json.dumps(endpoint)},"data":{dumps_payload(data)}}}}}'
+    ).encode("utf-8")
+
+
+def _send_post(transport: HTTPTransport, base_url: str, body: bytes, access_token: str) -> requests.Response:
+    return transport.post(
         f"{base_url}/prompts",
-        json={
-            "data":
-                {
-                    "method": "post",
-                    "headers": {
-                        "Content-Type": "application/json",
-                    },
-                    "route": endpoint,
-                    "data": data,
-                },
+        data=body,
+        headers={
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json",
         },
-        headers={"Authorization": f"Bearer {access_token}"},
     )
 
-    response_json = response.json()
+
+def _post_result(response: requests.Response, retry_policy: RetryPolicy) -> dict:
+    response_json = _response_json(response)
     if response.status_code != 200:
-        raise ValueError(f"Failed to post data: {response_json}")
+        raise GameAPIError(f"Failed to post data: {response_json}", response.status_code, response_json)
 
+    retry_policy.record_success()
     return response_json["data"]
 
 
+def post(base_url: str, api_key: str, endpoint: str, data: dict,
+         token_cache: Optional[AccessTokenCache] = None,
+         transport: Optional[HTTPTransport] = None,
+         retry_policy: Optional[RetryPolicy] = None,
+         token_url: Optional[str] = None,
+         timer: StepTimer = NULL_STEP_TIMER) -> dict:
+    """
+    API call to post data
+
+    Rate limited, unavailable and unreachable API calls are retried according to
+    `retry_policy` (defaults to `retry.default_retry_policy`). The time spent getting the
+    access token, serializing the data, on the network and waiting between retries is
+    added to `timer`.
+    """
+    token_cache = token_cache or default_token_cache
+    transport = transport or get_default_transport()
+    retry_policy = retry_policy or default_retry_policy
+    start = timer.start()
+    access_token = token_cache.get(api_key, transport, token_url, retry_policy)
+    timer.stop(PHASE_TOKEN, start)
+
+    # serialized once - retries resend the same body
+    start = timer.start()
+    body = _post_body(endpoint, data)
+    timer.stop(PHASE_SERIALIZE, start)
+
+    def send(access_token: str) -> requests.Response:
+        start = timer.start()
+        try:
+            return _send_post(transport, base_url, body, access_token)
+        finally:
+            timer.stop(PHASE_NETWORK, start)
+
+    def wait(delay: float):
+        start = timer.start()
+        time.sleep(delay)
+        timer.stop(PHASE_RETRY_WAIT, start)
+
+    attempt = 0
+    reauthenticated = False
+    while True:
+        try:
+            response = send(access_token)
+        except requests.exceptions.RequestException as e:
+            if not retry_policy.is_retryable_exception(e) or not retry_policy.should_retry(attempt):
+                raise
+            wait(retry_policy.get_delay(attempt))
+            attempt += 1
+            continue
+
+        if response.status_code == 401 and not reauthenticated:
+            # token was revoked or expired early - mint a new one and try once more
+            token_cache.invalidate(api_key, access_token)
+            start = timer.start()
+            access_token = token_cache.get(api_key, transport, token_url, retry_policy)
+            timer.stop(PHASE_TOKEN, start)
+            reauthenticated = True
+            continue
+
+        if (
+            retry_policy.is_retryable_status(response.status_code)
+            and retry_policy.should_retry(attempt)
+        ):
+            wait(retry_policy.get_delay(attempt, response))
+            attempt += 1
+            continue
+
+        break
+
+    return _post_result(response, retry_policy)
+
+
+async def async_post(base_url: str, api_key: str, endpoint: str, data: dict,
+                     token_cache: Optional[AccessTokenCache] = None,
+                     transport: Optional[AsyncHTTPTransport] = None,
+                     retry_policy: Optional[RetryPolicy] = None,
+                     token_url: Optional[str] = None,
+                     timer: StepTimer = NULL_STEP_TIMER) -> dict:
+    """
+    API call to post data from an event loop (see `post`)
+
+    Requests are made on the thread pool of the transport, and the waits between retries are
+    done on the event loop, so calls backing off do not hold threads of the pool.
+    """
+    token_cache = token_cache or default_token_cache
+    transport = transport or get_default_async_transport()
+    retry_policy = retry_policy or default_retry_policy
+    start = timer.start()
+    access_token = await transport.run(token_cache.get, api_key, transport.transport, token_url, retry_policy)
+    timer.stop(PHASE_TOKEN, start)
+
+    start = timer.start()
+    body = _post_body(endpoint, data)
+    timer.stop(PHASE_SERIALIZE, start)
+
+    async def send(access_token: str) -> requests.Response:
+        start = timer.start()
+        try:
+            return await transport.run(_send_post, transport.transport, base_url, body, access_token)
+        finally:
+            timer.stop(PHASE_NETWORK, start)
+
+    async def wait(delay: float):
+        start = timer.start()
+        await asyncio.sleep(delay)
+        timer.stop(PHASE_RETRY_WAIT, start)
+
+    attempt = 0
+    reauthenticated = False
+    while True:
+        try:
+            response = await send(access_token)
+        except requests.exceptions.RequestException as e:
+            if not retry_policy.is_retryable_exception(e) or not retry_policy.should_retry(attempt):
+                raise
+            await wait(retry_policy.get_delay(attempt))
+            attempt += 1
+            continue
+
+        if response.status_code == 401 and not reauthenticated:
+            token_cache.invalidate(api_key, access_token)
+            start = timer.start()
+            access_token = await transport.run(token_cache.get, api_key, transport.transport, token_url, retry_policy)
+            timer.stop(PHASE_TOKEN, start)
+            reauthenticated = True
+            continue
+
+        if (
+            retry_policy.is_retryable_status(response.status_code)
+            and retry_policy.should_retry(attempt)
+        ):
+            await wait(retry_policy.get_delay(attempt, response))
+            attempt += 1
+            continue
+
+        break
+
+    return _post_result(response, retry_policy)
+
+
 def create_agent(
         base_url: str,
         api_key: str,
         name: str,
         description: str,
-        goal: str) -> str:
+        goal: str,
+        transport: Optional[HTTPTransport] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        token_url: Optional[str] = None) -> str:
     """
     API call to create an agent instance (worker or agent with task generator)
     """
@@ -66,7 +430,10 @@ def create_agent(
             "name": name,
             "description": description,
             "goal": goal,
-        }
+        },
+        transport=transport,
+        retry_policy=retry_policy,
+        token_url=token_url,
     )
 
     return create_agent_response["id"]
@@ -74,7 +441,10 @@ def create_agent(
 
 def create_workers(base_url: str,
                    api_key: str,
-                   workers: List) -> str:
+                   workers: List,
+                   transport: Optional[HTTPTransport] = None,
+                   retry_policy: Optional[RetryPolicy] = None,
+                   token_url: Optional[str] = None) -> str:
     """
     API call to create workers and worker description for the task generator
     """
@@ -89,7 +459,42 @@ def create_workers(base_url: str,
                 for w in workers
             ]
         },
+        transport=transport,
+        retry_policy=retry_policy,
+        token_url=token_url,
     )
 
 
     return res["id"]
+
+
+def with_instructions(get_state_fn: Callable, get_instruction: Callable[[], str]) -> Callable:
+    """
+    Wrap a get_state_fn so that the current instructions are placed in the state it returns
+    (supports both regular and `async def` state functions)
+    """
+    if inspect.iscoroutinefunction(get_state_fn):
+        async def get_state(function_result, current_state):
+            return {
+                "instructions": get_instruction(),
+                # places the rest of the output of the get_state_fn in the state
+                **(await get_state_fn(function_result, current_state)),
+            }
+    else:
+        def get_state(function_result, current_state):
+            return {
+                "instructions": get_instruction(),
+                # places the rest of the output of the get_state_fn in the state
+                **get_state_fn(function_result, current_state),
+            }
+    return get_state
+
+
+async def call_maybe_async(fn: Callable, *args, **kwargs):
+    """
+    Call a regular or `async def` function (e.g. a state function) and return its result
+    """
+    result = fn(*args, **kwargs)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
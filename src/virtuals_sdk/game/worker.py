@@ -1,6 +1,37 @@
-from typing import Any, Callable, Dict, Optional, List
-from virtuals_sdk.game.custom_types import Function, FunctionResult, FunctionResultStatus, ActionResponse, ActionType
-from virtuals_sdk.game.utils import create_agent, post
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, List
+import concurrent.futures
+import copy
+import itertools
+import threading
+from virtuals_sdk.game.custom_types import ActionSpace, Function, EMPTY_FUNCTION_RESULT, FunctionResult, ActionResponse, ActionType
+from virtuals_sdk.game.utils import DEFAULT_BASE_URL, DEFAULT_TOKEN_URL, GameAPIError, create_agent, post, with_instructions
+from virtuals_sdk.game.state_diff import StateDiffEncoder
+from virtuals_sdk.game.state_budget import StateBudget
+from virtuals_sdk.game.checkpoint import AutoCheckpoint, read_checkpoint, write_checkpoint
+from virtuals_sdk.game.observers import (
+    NULL_STEP_TIMER, PHASE_EXECUTE, PHASE_PAYLOAD, PHASE_STATE, PHASE_VALIDATE,
+    StepObserver, StepTimer, build_step_info, get_observer,
+)
+from virtuals_sdk.game.retry import RetryPolicy
+from virtuals_sdk.game.worker_pool import WorkerPool
+from virtuals_sdk.transport import HTTPTransport, get_default_transport
+
+
+@dataclass
+class TaskResult:
+    """
+    Outcome of a task run by `Worker.run_many`
+    """
+    index: int  # position of the task in the tasks given
+    task: str
+    submission_id: Optional[str] = None
+    # state of the worker and result of the last function call when the task ended
+    state: Any = None
+    function_result: Optional[FunctionResult] = None
+    steps: int = 0
+    # exception that ended the task (None if it completed)
+    error: Optional[BaseException] = None
 
 
 class Worker:
@@ -16,10 +47,49 @@ class Worker:
         action_space: List[Function],
         # specific additional instruction for the worker (PROMPT)
         instruction: Optional[str] = "",
+        # pooled HTTP transport (defaults to the transport shared by all clients)
+        transport: Optional[HTTPTransport] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        # send the state as a diff against the state sent in the previous step (see game.state_diff)
+        send_state_diffs: bool = False,
+        # GAME API endpoints (can be overridden, e.g. to point at a local stand-in server)
+        base_url: Optional[str] = None,
+        token_url: Optional[str] = None,
+        # receives the actions and per-phase timings of every step
+        observer: Optional[StepObserver] = None,
+        # print the progress of every step (no output is formatted when False)
+        verbose: bool = True,
+        # reuse the remote agent of workers with the same configuration (None to create a new one)
+        worker_pool: Optional[WorkerPool] = None,
+        # default file of checkpoint/restore, written after steps every checkpoint_interval seconds if set
+        checkpoint_path: Optional[str] = None,
+        checkpoint_interval: Optional[float] = None,
+        # fully validate action responses (instead of validating the agent state on first access)
+        strict_responses: bool = False,
+        # size budget of the state sent to GAME (see game.state_budget)
+        state_budget: Optional[StateBudget] = None,
+        # key of the states of this worker in the stats of the budget (e.g. the worker id)
+        state_budget_key: Optional[str] = None,
     ):
 
-        self._base_url: str = "https://game.virtuals.io"
+        self._base_url: str = base_url or DEFAULT_BASE_URL
+        self._token_url: str = token_url or DEFAULT_TOKEN_URL
         self._api_key: str = api_key
+        self._transport: HTTPTransport = transport or get_default_transport()
+        # retry policy for failed API calls (None for the default policy)
+        self._retry_policy: Optional[RetryPolicy] = retry_policy
+        self._send_state_diffs: bool = send_state_diffs
+        self._state_encoder: StateDiffEncoder = StateDiffEncoder("environment")
+        self._observer: Optional[StepObserver] = get_observer(observer, verbose)
+        self._worker_pool: Optional[WorkerPool] = worker_pool
+        self._strict_responses: bool = strict_responses
+        self._state_budget: Optional[StateBudget] = state_budget
+        self._state_budget_key: Optional[str] = state_budget_key
+        self._checkpoint_path: Optional[str] = checkpoint_path
+        self._auto_checkpoint: Optional[AutoCheckpoint] = (
+            AutoCheckpoint(checkpoint_path, checkpoint_interval)
+            if checkpoint_path is not None and checkpoint_interval is not None else None
+        )
 
         # checks
         if not self._api_key:
@@ -28,33 +98,14 @@ class Worker:
         self.description: str = description
         self.instruction: str = instruction
 
-        # setup get state function and initial state
-        self.get_state_fn = lambda function_result, current_state: {
-            "instructions": self.instruction,  # instructions are set up in the state
-            # places the rest of the output of the get_state_fn in the state
-            **get_state_fn(function_result, current_state),
-        }
-        dummy_function_result = FunctionResult(
-            action_id="",
-            action_status=FunctionResultStatus.DONE,
-            feedback_message="",
-            info={},
-        )
-        # get state
-        self.state = self.get_state_fn(dummy_function_result, None)
+        # setup get state function (instructions are set up in the state)
+        self.get_state_fn = with_instructions(get_state_fn, lambda: self.instruction)
 
         # # setup action space (functions/tools available to the worker)
-        # check action space type - if not a dict
-        if not isinstance(action_space, dict):
-            self.action_space = {
-                f.get_function_def()["fn_name"]: f for f in action_space}
-        else:
-            self.action_space = action_space
-
-        # initialize an agent instance for the worker
-        self._agent_id: str = create_agent(
-            self._base_url, self._api_key, "StandaloneWorker", self.description, "N/A"
-        )
+        # function definitions are computed once and reused on every step
+        if not isinstance(action_space, ActionSpace):
+            action_space = ActionSpace(action_space)
+        self.action_space: ActionSpace = action_space
 
         # persistent variables that is maintained through the worker running
         # task ID for everytime you provide/update the task (i.e. ask the agent to do something)
@@ -62,6 +113,36 @@ class Worker:
         # current response from the Agent
         self._function_result: Optional[FunctionResult] = None
 
+        self.state = None
+        self._agent_id: Optional[str] = None
+        self._provision()
+
+    def _provision(self):
+        """
+        Sets up the initial state and creates the agent instance for the worker
+        """
+        # get state
+        self.state = self.get_state_fn(EMPTY_FUNCTION_RESULT, None)
+
+        # initialize an agent instance for the worker (or reuse the one of the pool)
+        if self._worker_pool is None:
+            self._agent_id = self._create_remote_agent()
+        else:
+            self._agent_id = self._worker_pool.get_agent_id(self._pool_key(), self._create_remote_agent)
+
+    def _create_remote_agent(self) -> str:
+        return create_agent(
+            self._base_url, self._api_key, "StandaloneWorker", self.description, "N/A",
+            transport=self._transport,
+            retry_policy=self._retry_policy,
+            token_url=self._token_url,
+        )
+
+    def _pool_key(self) -> str:
+        return WorkerPool.fingerprint(
+            self._api_key, self._base_url, self.description, self.instruction,
+            self.action_space.serialized_function_defs)
+
     def set_task(self, task: str):
         """
         Sets the task for the agent
@@ -71,6 +152,9 @@ class Worker:
             api_key=self._api_key,
             endpoint=f"/v2/agents/{self._agent_id}/tasks",
             data={"task": task},
+            transport=self._transport,
+            retry_policy=self._retry_policy,
+            token_url=self._token_url,
         )
         # response_json = set_task_response.json()
 
@@ -79,90 +163,292 @@ class Worker:
 
         # task ID
         self._submission_id = set_task_response["submission_id"]
+        # new task - the state is sent in full with its first step
+        self._state_encoder.reset()
 
         return self._submission_id
 
-    def _get_action(
-        self,
-        # results of the previous action (if any)
-        function_result: Optional[FunctionResult] = None
-    ) -> ActionResponse:
+    def _get_action_data(self, function_result: Optional[FunctionResult] = None) -> dict:
         """
-        Gets the agent action from the GAME API
+        Builds the payload sent to the GAME API to get the next action
         """
         # dummy function result if None is provided - for get_state_fn to take the same input all the time
         if function_result is None:
-            function_result = FunctionResult(
-                action_id="",
-                action_status=FunctionResultStatus.DONE,
-                feedback_message="",
-                info={},
-            )
+            function_result = EMPTY_FUNCTION_RESULT
         # set up data payload
         data = {
             "environment": self.state,  # state (updated state)
-            "functions": [
-                f.get_function_def() for f in self.action_space.values()  # functions available
-            ],
-            "action_result": (
-                function_result.model_dump(
-                    exclude={'info'}) if function_result else None
-            ),
+            "functions": self.action_space.step_function_defs(),  # functions available this step
+            "action_result": function_result.to_wire() if function_result else None,
         }
 
+        if self._state_budget is not None:
+            # compact the state if it is over budget (serialized right away unless it is diffed)
+            data["environment"] = self._state_budget.apply(
+                data["environment"], not self._send_state_diffs, self._state_budget_key)
+
+        if self._send_state_diffs:
+            # replace the full state by a diff against the state sent in the previous step
+            data.update(self._state_encoder.encode(data.pop("environment")))
+
+        return data
+
+    def _build_action_data(self, function_result: Optional[FunctionResult], timer: StepTimer) -> dict:
+        start = timer.start()
+        data = self._get_action_data(function_result)
+        timer.stop(PHASE_PAYLOAD, start)
+        return data
+
+    def _next_endpoint(self) -> str:
+        return f"/v2/agents/{self._agent_id}/tasks/{self._submission_id}/next"
+
+    def _get_recovery(self, error: GameAPIError, resynced: bool) -> Optional[str]:
+        """
+        How to recover from a failed request for the next action: "resync" (send the full state again)
+        or None (the error is raised)
+        """
+        if self._send_state_diffs and error.status_code == 409 and not resynced:
+            return "resync"
+        return None
+
+    def _reset_state_encoders(self):
+        self._state_encoder.reset()
+
+    def _resync_state(self, function_result: Optional[FunctionResult], timer: StepTimer) -> dict:
+        """Payload with the full state (when the API could not apply the state diff)"""
+        self._reset_state_encoders()
+        return self._build_action_data(function_result, timer)
+
+    def _decode_action(self, response: dict, timer: StepTimer) -> ActionResponse:
+        start = timer.start()
+        action_response = ActionResponse.from_response(response, self._strict_responses)
+        timer.stop(PHASE_VALIDATE, start)
+        return action_response
+
+    def _get_action(
+        self,
+        # results of the previous action (if any)
+        function_result: Optional[FunctionResult] = None,
+        timer: StepTimer = NULL_STEP_TIMER,
+    ) -> ActionResponse:
+        """
+        Gets the agent action from the GAME API
+        """
+        data = self._build_action_data(function_result, timer)
+
         # make API call
-        response = post(
-            base_url=self._base_url,
-            api_key=self._api_key,
-            endpoint=f"/v2/agents/{self._agent_id}/tasks/{self._submission_id}/next",
-            data=data,
-        )
+        resynced = False
+        try:
+            while True:
+                try:
+                    response = post(
+                        base_url=self._base_url,
+                        api_key=self._api_key,
+                        endpoint=self._next_endpoint(),
+                        data=data,
+                        transport=self._transport,
+                        retry_policy=self._retry_policy,
+                        token_url=self._token_url,
+                        timer=timer,
+                    )
+                    break
+                except GameAPIError as e:
+                    if self._get_recovery(e, resynced) is None:
+                        raise
+                    # state diff could not be applied - send the full state
+                    resynced = True
+                data = self._resync_state(function_result, timer)
+        except BaseException:
+            # the API may not have applied the state sent - send it in full with the next step
+            self._reset_state_encoders()
+            raise
 
-        return ActionResponse.model_validate(response)
+        return self._decode_action(response, timer)
 
-    def step(self):
+    def _get_checkpoint_path(self, path: Optional[str]) -> str:
+        path = path or self._checkpoint_path
+        if path is None:
+            raise ValueError("No checkpoint path")
+        return path
+
+    def _checkpoint_data(self) -> Dict[str, Any]:
+        function_result = self._function_result
+        return {
+            "kind": "worker",
+            "agent_id": self._agent_id,
+            "submission_id": self._submission_id,
+            "state": self.state,
+            "function_result": function_result.model_dump(mode="json") if function_result is not None else None,
+        }
+
+    def checkpoint(self, path: Optional[str] = None):
         """
-        Execute the next step in the task - requires a task ID (i.e. task ID)
+        Saves the task of the worker (task ID, state and last function result) to `path`
+        """
+        write_checkpoint(self._get_checkpoint_path(path), self._checkpoint_data())
+
+    def restore(self, path: Optional[str] = None) -> bool:
         """
+        Resumes the task saved by `checkpoint` (continued by `run()` without a task).
+        Returns False if there is no checkpoint at `path`.
+        """
+        data = read_checkpoint(self._get_checkpoint_path(path), "worker")
+        if data is None:
+            return False
+        self._agent_id = data["agent_id"]
+        self._submission_id = data["submission_id"]
+        self.state = data["state"]
+        self._function_result = (
+            FunctionResult.model_validate(data["function_result"]) if data["function_result"] is not None else None
+        )
+        # the state is sent in full with the next step
+        self._state_encoder.reset()
+        return True
+
+    def _new_step_timer(self) -> StepTimer:
+        # steps are only timed when observed
+        return StepTimer() if self._observer is not None else NULL_STEP_TIMER
+
+    def _observe_step(self, action_response: ActionResponse, timer: StepTimer, submission_id: Optional[str],
+                      function_result: Optional[FunctionResult]):
+        self._observer.on_step(build_step_info(
+            action_response, timer, function_result, agent_id=self._agent_id, submission_id=submission_id))
+
+    def _start_step(self) -> StepTimer:
         if not self._submission_id:
             raise ValueError("No task set")
+        return self._new_step_timer()
 
-        # get action from GAME API (Agent)
-        action_response = self._get_action(self._function_result)
-        action_type = action_response.action_type
-
-        print(f"Action response: {action_response}")
-        print(f"Action type: {action_type}")
+    def _select_function(self, action_response: ActionResponse) -> Optional[Function]:
+        """
+        Function to execute for the action selected by GAME (None if the task ended)
+        """
+        if self._observer is not None:
+            self._observer.on_action(action_response)
 
-        # execute action
-        if action_type == ActionType.CALL_FUNCTION:
+        if action_response.action_type == ActionType.CALL_FUNCTION:
             if not action_response.action_args:
                 raise ValueError("No function information provided by GAME")
+            return self.action_space.get_function(action_response.action_args["fn_name"])
+
+        if action_response.action_type == ActionType.WAIT:
+            if self._observer is not None:
+                self._observer.on_message("Task completed or ended (not possible)")
+            self._submission_id = None
+            return None
+
+        raise ValueError(
+            f"Unexpected action type: {action_response.action_type}")
+
+    def _on_function_result(self, function_result: FunctionResult):
+        self._function_result = function_result
+        if self._observer is not None:
+            self._observer.on_function_result(function_result)
 
-            self._function_result = self.action_space[
-                action_response.action_args["fn_name"]
-            ].execute(**action_response.action_args)
+    def _end_step(self, action_response: ActionResponse, timer: StepTimer, submission_id: Optional[str],
+                  function_result: Optional[FunctionResult]) -> bool:
+        """Observe the step - returns whether a checkpoint is due"""
+        if self._observer is not None:
+            self._observe_step(action_response, timer, submission_id, function_result)
+        return self._auto_checkpoint is not None and self._auto_checkpoint.due()
 
-            print(f"Function result: {self._function_result}")
+    def step(self):
+        """
+        Execute the next step in the task - requires a task ID (i.e. task ID)
+        """
+        timer = self._start_step()
+        submission_id = self._submission_id
+        function_result = None
+
+        # get action from GAME API (Agent)
+        action_response = self._get_action(self._function_result, timer)
+        function = self._select_function(action_response)
+
+        # execute action
+        if function is not None:
+            start = timer.start()
+            function_result = function.execute(**action_response.action_args)
+            timer.stop(PHASE_EXECUTE, start)
+            self._on_function_result(function_result)
 
             # update state
-            self.state = self.get_state_fn(self._function_result, self.state)
+            start = timer.start()
+            self.state = self.get_state_fn(function_result, self.state)
+            timer.stop(PHASE_STATE, start)
 
-        elif action_response.action_type == ActionType.WAIT:
-            print("Task completed or ended (not possible)")
-            self._submission_id = None
+        if self._end_step(action_response, timer, submission_id, function_result):
+            self._auto_checkpoint.write(self._checkpoint_data())
 
-        else:
-            raise ValueError(
-                f"Unexpected action type: {action_response.action_type}")
+        return action_response, self._function_result
+
+    def _fork(self) -> "Worker":
+        """
+        Worker with the configuration and remote agent of this one, but its own task and state
+        """
+        worker = copy.copy(self)
+        worker._submission_id = None
+        worker._function_result = None
+        worker.state = None
+        worker._state_encoder = StateDiffEncoder("environment")
+        worker._auto_checkpoint = None
+        return worker
 
-        return action_response, self._function_result.model_copy()
+    def _run_task(self, index: int, task: str, stop: Optional[threading.Event] = None) -> TaskResult:
+        worker = self._fork()
+        result = TaskResult(index=index, task=task)
+        try:
+            worker.state = worker.get_state_fn(EMPTY_FUNCTION_RESULT, None)
+            result.submission_id = worker.set_task(task)
+            # stop: set when the results are no longer wanted (the task is left after its current step)
+            while worker._submission_id and not (stop is not None and stop.is_set()):
+                worker.step()
+                result.steps += 1
+        except Exception as e:
+            result.error = e
+        result.state = worker.state
+        result.function_result = worker._function_result
+        return result
 
-    def run(self, task: str):
+    def run_many(self, tasks: Iterable[str], concurrency: int = 4) -> Iterator[TaskResult]:
         """
-        Gets the agent to complete the task on its own autonomously
+        Runs tasks concurrently (at most `concurrency` at a time) on the remote agent of the worker,
+        each with its own task ID and state, and yields their results as they complete.
+        Tasks are taken from `tasks` as slots free up, so it can be a long (or endless) iterator.
+        A failed task does not stop the others - its exception is in its result.
         """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        tasks = enumerate(tasks)
+        stop = threading.Event()
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="game-worker-task")
+        pending = {
+            executor.submit(self._run_task, index, task, stop)
+            for index, task in itertools.islice(tasks, concurrency)
+        }
+        try:
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    for index, task in itertools.islice(tasks, 1):
+                        pending.add(executor.submit(self._run_task, index, task, stop))
+                    yield future.result()
+        finally:
+            # the iteration was stopped early - do not wait for the running tasks,
+            # which stop after their current step
+            stop.set()
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
 
-        self.set_task(task)
+    def run(self, task: Optional[str] = None):
+        """
+        Gets the agent to complete the task on its own autonomously
+        (None to continue the current task, e.g. a restored one)
+        """
+        if task is not None:
+            self.set_task(task)
+        elif not self._submission_id:
+            raise ValueError("No task set")
         while self._submission_id:
             self.step()
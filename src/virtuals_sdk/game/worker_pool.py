@@ -0,0 +1,116 @@
+import asyncio
+import collections
+import hashlib
+import threading
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class WorkerPool:
+    """
+    Remote (GAME) agents of standalone workers, reused by workers with the same configuration.
+
+    Every worker created with a pool gets the remote agent of the first worker created with
+    the same API key, endpoint, description, instruction and action space, instead of
+    creating a new one - so getting a worker costs no provisioning round trip after the
+    first, and no remote agent is left behind per worker. The workers themselves are not
+    shared: each one has its own task and state, so several tasks can run at the same time
+    on the same remote agent.
+    """
+
+    def __init__(self, max_size: int = 256):
+        """
+        Args:
+            max_size: number of remote agents kept (least recently used ones are forgotten)
+        """
+        self.max_size = max_size
+        self._agent_ids: "collections.OrderedDict[str, str]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def fingerprint(api_key: str, base_url: str, description: str, instruction: Optional[str],
+                    serialized_function_defs: str) -> str:
+        """Key of a worker configuration"""
+        digest = hashlib.sha256()
+        # the API key is hashed separately so it can not be recovered from the fingerprint
+        for part in (hashlib.sha256(api_key.encode("utf-8")).hexdigest(), base_url, description,
+                     instruction or "", serialized_function_defs):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock:
+            agent_id = self._agent_ids.get(key)
+            if agent_id is not None:
+                self._agent_ids.move_to_end(key)
+            return agent_id
+
+    def _put(self, key: str, agent_id: str):
+        with self._lock:
+            self._agent_ids[key] = agent_id
+            self._agent_ids.move_to_end(key)
+            while len(self._agent_ids) > self.max_size:
+                self._agent_ids.popitem(last=False)
+
+    def get_agent_id(self, key: str, create: Callable[[], str]) -> str:
+        """
+        Remote agent id of a worker configuration, created with `create` if there is none
+        (once, however many threads ask for it at the same time)
+        """
+        agent_id = self._get(key)
+        if agent_id is not None:
+            return agent_id
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            agent_id = self._get(key)
+            if agent_id is None:
+                agent_id = create()
+                self._put(key, agent_id)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return agent_id
+
+    async def aget_agent_id(self, key: str, create: Callable[[], Awaitable[str]]) -> str:
+        """
+        Remote agent id of a worker configuration, created with `create` if there is none
+        (once, however many tasks ask for it at the same time)
+        """
+        agent_id = self._get(key)
+        if agent_id is not None:
+            return agent_id
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        pending = self._pending[key] = asyncio.get_running_loop().create_future()
+        try:
+            agent_id = await create()
+            self._put(key, agent_id)
+            pending.set_result(agent_id)
+        except BaseException as e:
+            pending.set_exception(e)
+            # retrieved so a failure nobody else waited for is not logged
+            pending.exception()
+            raise
+        finally:
+            self._pending.pop(key, None)
+        return agent_id
+
+    def invalidate(self, key: str):
+        """Forget the remote agent of a worker configuration (e.g. it was deleted)"""
+        with self._lock:
+            self._agent_ids.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._agent_ids.clear()
+
+    def __len__(self) -> int:
+        return len(self._agent_ids)
+
+
+# pool shared by the workers created by agents (`Agent.get_worker`)
+default_worker_pool = WorkerPool()
@@ -0,0 +1,283 @@
+import collections
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, Deque, Dict, Iterable, Optional, Tuple, Union
+import requests
+from requests.structures import CaseInsensitiveDict
+from virtuals_sdk.game.state_diff import StateDiffDecoder, StateResyncRequired
+from virtuals_sdk.transport import HTTPTransport
+
+# fields of step payloads that can be sent as diffs (see game.state_diff)
+STATE_FIELDS = ("environment", "agent_state")
+
+_EMPTY_AGENT_STATE = {"hlp": None, "current_task": None}
+
+# default functions listed by the twitter agent `/functions` endpoint
+DEFAULT_TWITTER_FUNCTIONS = [
+    {"fn_name": "wait", "fn_description": "Wait for the next heartbeat"},
+    {"fn_name": "post_tweet", "fn_description": "Post a new tweet"},
+    {"fn_name": "reply_tweet", "fn_description": "Reply to a tweet"},
+    {"fn_name": "like_tweet", "fn_description": "Like a tweet"},
+    {"fn_name": "quote_tweet", "fn_description": "Quote a tweet"},
+    {"fn_name": "search_internet", "fn_description": "Search the internet"},
+]
+
+# JSON response (status, content, headers)
+Response = Tuple[int, Any, Dict[str, str]]
+
+
+def default_actions(route: str, data: dict, step: int) -> dict:
+    """
+    Default scripted behaviour: call the first available function with no arguments,
+    and end worker tasks after one function call
+    """
+    if route.endswith("/next") and step % 2 == 1:
+        return {"action_type": "wait", "agent_state": _EMPTY_AGENT_STATE}
+    functions = data.get("functions") or []
+    if not functions:
+        return {"action_type": "wait", "agent_state": _EMPTY_AGENT_STATE}
+    return {
+        "action_type": "call_function",
+        "agent_state": _EMPTY_AGENT_STATE,
+        "action_args": {"fn_id": str(step), "fn_name": functions[0]["fn_name"], "args": {}},
+    }
+
+
+class LocalGameAPI:
+    """
+    In-process stand-in for the GAME API, for running agents and workers offline.
+
+    Implements the access token endpoint, the `/prompts` route envelope used by
+    `game.utils.post` (`/v2/agents`, `/v2/maps`, `/v2/agents/{id}/actions`,
+    `/v2/agents/{id}/tasks` and `/v2/agents/{id}/tasks/{submission_id}/next`) and the
+    twitter agent endpoints (`/functions`, `/simulate`, `/react/{platform}`, `/deploy`).
+    Step payloads sent as state diffs are reconstructed to full states, and the number
+    and size of the requests received are counted (`stats`).
+
+    Use it in-process through `LocalTransport`, or over HTTP through `server.LocalGameServer`.
+    """
+
+    def __init__(
+        self,
+        actions: Union[Iterable[dict], Callable[[str, dict, int], dict], None] = None,
+        latency: Union[float, Tuple[float, float]] = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        replay: Optional[Iterable[dict]] = None,
+        twitter_responses: Optional[Dict[str, Any]] = None,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            actions: the actions returned for `/actions` and `/next` requests - either a sequence
+                of action responses (repeated when exhausted) or a function of
+                (route, request data, step number within the agent/task) returning one
+                (defaults to `default_actions`)
+            latency: seconds added to every request, or a (min, max) range to draw it from
+            error_rate: fraction of requests (other than token requests) answered with `error_status`
+            error_status: HTTP status of injected errors
+            replay: recorded traffic (see `recording.load_recording`) - requests matching a recorded
+                request are answered with the recorded responses, in the recorded order
+            twitter_responses: response data of the twitter agent endpoints, by endpoint
+                ("functions", "simulate", "react", "deploy")
+            seed: seed of the random latency and errors
+        """
+        if actions is None:
+            self._next_action = default_actions
+        elif callable(actions):
+            self._next_action = actions
+        else:
+            action_cycle = itertools.cycle(list(actions))
+            self._next_action = lambda route, data, step: next(action_cycle)
+
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.twitter_responses: Dict[str, Any] = dict(twitter_responses or {})
+        self._random = random.Random(seed)
+        # scripted failures: (status, headers) of the next responses
+        self._failures: Deque[Tuple[int, Dict[str, str]]] = collections.deque()
+
+        self._replay: Dict[Tuple[str, str, Optional[str]], Deque[Tuple[int, Any]]] = {}
+        for record in replay or []:
+            key = (record["method"].lower(), record["path"], record.get("route"))
+            self._replay.setdefault(key, collections.deque()).append(
+                (record["status"], record["response"]))
+
+        self.decoder = StateDiffDecoder()
+        # last full state received per session and field
+        self.states: Dict[Tuple[str, str], Any] = {}
+        self.stats: Dict[str, int] = {}
+        self.reset_stats()
+        self._steps: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def reset_stats(self):
+        self.stats = {"requests": 0, "request_bytes": 0, "resyncs": 0, "injected_errors": 0, "replayed": 0}
+
+    def fail_next(self, status_code: int = 503, count: int = 1, retry_after: Optional[float] = None):
+        """
+        Answer the next `count` requests (other than token requests) with an error
+        """
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+        for _ in range(count):
+            self._failures.append((status_code, headers))
+
+    def _count(self, stat: str, value: int = 1):
+        with self._lock:
+            self.stats[stat] += value
+
+    def _injected_error(self) -> Optional[Response]:
+        with self._lock:
+            if self._failures:
+                status_code, headers = self._failures.popleft()
+            elif self.error_rate and self._random.random() < self.error_rate:
+                status_code, headers = self.error_status, {}
+            else:
+                return None
+            self.stats["injected_errors"] += 1
+        return status_code, {"error": "injected error"}, headers
+
+    def _delay(self):
+        latency = self.latency
+        if isinstance(latency, (tuple, list)):
+            with self._lock:
+                latency = self._random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+
+    def handle(self, method: str, path: str, body: Optional[bytes]) -> Response:
+        """
+        Handle a request to the API, returning the HTTP status, the JSON response and response headers
+        """
+        self._count("requests")
+        self._count("request_bytes", len(body or b""))
+        self._delay()
+
+        payload = json.loads(body) if body else {}
+
+        if path.endswith("/accesses/tokens"):
+            return 200, {"data": {"accessToken": f"local-{uuid.uuid4().hex}"}}, {}
+
+        error = self._injected_error()
+        if error is not None:
+            return error
+
+        route = payload.get("data", {}).get("route") if path.endswith("/prompts") else None
+        replayed = self._replayed(method, path, route)
+        if replayed is not None:
+            return replayed
+
+        if path.endswith("/prompts"):
+            request = payload.get("data", {})
+            try:
+                return 200, {"data": self.handle_route(route or "", request.get("data") or {})}, {}
+            except StateResyncRequired as e:
+                self._count("resyncs")
+                return 409, {"error": "state_resync_required", "message": str(e)}, {}
+            except ValueError as e:
+                return 404, {"error": str(e)}, {}
+
+        twitter_response = self.handle_twitter(method, path, payload.get("data") or {})
+        if twitter_response is not None:
+            return 200, {"data": twitter_response}, {}
+
+        return 404, {"error": f"Unknown endpoint: {method.upper()} {path}"}, {}
+
+    def _replayed(self, method: str, path: str, route: Optional[str]) -> Optional[Response]:
+        with self._lock:
+            responses = self._replay.get((method.lower(), path, route))
+            if not responses:
+                return None
+            status_code, content = responses.popleft()
+            self.stats["replayed"] += 1
+        return status_code, content, {}
+
+    def handle_route(self, route: str, data: dict) -> dict:
+        """
+        Handle a GAME route sent through the `/prompts` envelope, returning its response data
+        """
+        parts = route.strip("/").split("/")
+        if route == "/v2/agents":
+            return {"id": f"agent-{uuid.uuid4().hex[:12]}"}
+        if route == "/v2/maps":
+            return {"id": f"map-{uuid.uuid4().hex[:12]}"}
+        if len(parts) == 4 and parts[3] == "actions":
+            return self._step(route, data)
+        if len(parts) == 4 and parts[3] == "tasks":
+            return {"submission_id": f"submission-{uuid.uuid4().hex[:12]}"}
+        if len(parts) == 6 and parts[3] == "tasks" and parts[5] == "next":
+            return self._step(route, data)
+        raise ValueError(f"Unknown route: {route}")
+
+    def handle_twitter(self, method: str, path: str, data: dict) -> Optional[Any]:
+        """
+        Handle a twitter agent endpoint, returning its response data (None if the path is not one)
+        """
+        parts = path.strip("/").split("/")
+        endpoint = parts[-2] if len(parts) >= 2 and parts[-2] == "react" else parts[-1]
+        if endpoint in self.twitter_responses:
+            return self.twitter_responses[endpoint]
+        if endpoint == "functions" and method.lower() == "get":
+            return DEFAULT_TWITTER_FUNCTIONS
+        if endpoint in ("simulate", "react"):
+            return {
+                "sessionId": data.get("sessionId"),
+                "platform": parts[-1] if endpoint == "react" else "twitter",
+                "functions": data.get("functions", []),
+                "actions": [],
+            }
+        if endpoint == "deploy":
+            return {"id": f"deployment-{uuid.uuid4().hex[:12]}", "status": "deployed"}
+        return None
+
+    def _step(self, route: str, data: dict) -> dict:
+        location = data.get("location")
+        for field in STATE_FIELDS:
+            # worker states are tracked per location (worker) of the agent
+            key = f"{route}#{location}" if field == "environment" and location else route
+            state = self.decoder.decode(key, field, data)
+            if state is not None:
+                data[field] = state
+                self.states[(key, field)] = state
+
+        with self._lock:
+            step = self._steps.get(route, 0)
+            self._steps[route] = step + 1
+        return self._next_action(route, data, step)
+
+
+def _make_response(url: str, status_code: int, content: Any, headers: Dict[str, str]) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = url
+    response.reason = "OK" if status_code < 400 else "Error"
+    response.headers = CaseInsensitiveDict({"Content-Type": "application/json", **headers})
+    response._content = json.dumps(content).encode("utf-8")
+    response.encoding = "utf-8"
+    return response
+
+
+class LocalTransport(HTTPTransport):
+    """
+    Transport that answers every request with a LocalGameAPI instead of going over the network
+    """
+
+    def __init__(self, api: Optional[LocalGameAPI] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.api = api or LocalGameAPI()
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        if kwargs.get("json") is not None:
+            body = json.dumps(kwargs["json"]).encode("utf-8")
+        else:
+            body = kwargs.get("data")
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+        path = url.split("://", 1)[-1].partition("/")[2]
+        status_code, content, headers = self.api.handle(method, "/" + path.split("?", 1)[0], body)
+        return _make_response(url, status_code, content, headers)
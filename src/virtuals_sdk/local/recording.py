@@ -0,0 +1,84 @@
+import json
+import threading
+import time
+from typing import Any, List, Optional
+from urllib.parse import urlparse
+import requests
+from virtuals_sdk.transport import HTTPTransport, get_default_transport
+
+
+def _json_body(body: Any) -> Any:
+    if body is None:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode("utf-8")
+    try:
+        return json.loads(body)
+    except ValueError:
+        return body
+
+
+class RecordingTransport(HTTPTransport):
+    """
+    Transport that makes requests through another transport and appends every request
+    and its response to a JSONL file, e.g. to replay real traffic with `LocalGameAPI(replay=...)`.
+
+    Request headers (which carry the API key and access tokens) are not recorded, and
+    access tokens in token responses are redacted. Request bodies - including the states
+    sent to GAME - are recorded as is.
+    """
+
+    def __init__(self, path: str, transport: Optional[HTTPTransport] = None):
+        self.path = path
+        self.transport = transport or get_default_transport()
+        self.timeout = self.transport.timeout
+        self.pool_maxsize = self.transport.pool_maxsize
+        self.session = self.transport.session
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        start = time.perf_counter()
+        response = self.transport.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        path = urlparse(url).path
+        request_body = kwargs["json"] if kwargs.get("json") is not None else _json_body(kwargs.get("data"))
+        route = None
+        if path.endswith("/prompts") and isinstance(request_body, dict):
+            route = request_body.get("data", {}).get("route")
+
+        try:
+            response_body = response.json()
+        except ValueError:
+            response_body = response.text
+        if path.endswith("/accesses/tokens") and isinstance(response_body, dict):
+            response_body = {"data": {"accessToken": "<redacted>"}}
+
+        record = {
+            "time": time.time(),
+            "method": method.lower(),
+            "path": path,
+            "route": route,
+            "request": request_body,
+            "status": response.status_code,
+            "response": response_body,
+            "elapsed": round(elapsed, 6),
+        }
+        line = json.dumps(record, separators=(",", ":"))
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line + "\n")
+
+        return response
+
+    def close(self):
+        # the wrapped transport may be shared - it is left open
+        pass
+
+
+def load_recording(path: str) -> List[dict]:
+    """
+    Load the requests and responses recorded by a RecordingTransport
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,140 @@
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from virtuals_sdk.local.game_api import LocalGameAPI
+from virtuals_sdk.local.recording import load_recording
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    api: LocalGameAPI = None
+    verbose: bool = False
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else None
+        status_code, content, headers = self.api.handle(self.command, self.path.split("?", 1)[0], body)
+
+        data = json.dumps(content).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+class LocalGameServer:
+    """
+    Serves a LocalGameAPI over HTTP, so agents, workers and the twitter agent SDK can be
+    pointed at it (e.g. from other processes or load testing tools):
+
+        with LocalGameServer() as server:
+            agent = Agent(..., base_url=server.base_url, token_url=server.token_url)
+            twitter_agent = twitter_agent.Agent(..., api_url=server.twitter_api_url)
+    """
+
+    def __init__(self, api: Optional[LocalGameAPI] = None, host: str = "127.0.0.1", port: int = 0,
+                 verbose: bool = False):
+        """
+        Args:
+            api: the stand-in API to serve (defaults to a LocalGameAPI with default settings)
+            host: interface to listen on
+            port: port to listen on (0 to pick a free port)
+            verbose: log every request
+        """
+        self.api = api or LocalGameAPI()
+        handler = type("Handler", (_Handler,), {"api": self.api, "verbose": verbose})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_url(self) -> str:
+        """`base_url` of GAME agents and workers"""
+        return self.url
+
+    @property
+    def token_url(self) -> str:
+        """`token_url` of GAME agents and workers"""
+        return f"{self.url}/api/accesses/tokens"
+
+    @property
+    def twitter_api_url(self) -> str:
+        """`api_url` of the twitter agent"""
+        return f"{self.url}/api"
+
+    def start(self):
+        """Serve requests from a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the GAME API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--actions", help="JSONL file of action responses to return (in order, repeated)")
+    parser.add_argument("--replay", help="JSONL file recorded with RecordingTransport to replay")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of injected errors")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    actions = None
+    if args.actions:
+        with open(args.actions) as f:
+            actions = [json.loads(line) for line in f if line.strip()]
+
+    api = LocalGameAPI(
+        actions=actions,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        replay=load_recording(args.replay) if args.replay else None,
+        seed=args.seed,
+    )
+    server = LocalGameServer(api, host=args.host, port=args.port, verbose=args.verbose)
+    print(f"GAME API stand-in listening on {server.url}")
+    print(f"  base_url={server.base_url} token_url={server.token_url} twitter api_url={server.twitter_api_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import asyncio
+import functools
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+# (connect timeout, read timeout) in seconds
+DEFAULT_TIMEOUT: Tuple[float, float] = (10.0, 120.0)
+
+
+class HTTPTransport:
+    """
+    Pooled HTTP transport with keep-alive connections.
+
+    A single transport can be shared by GAME agents and workers, the twitter agent
+    GameSDK and custom twitter agent Functions so that connections (and their TCP/TLS
+    handshakes) are reused across calls instead of being set up on every request.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        host_pool_sizes: Optional[Dict[str, int]] = None,
+        timeout: Union[float, Tuple[float, float], None] = DEFAULT_TIMEOUT,
+    ):
+        """
+        Args:
+            pool_connections: number of hosts to keep connection pools for
+            pool_maxsize: maximum number of keep-alive connections kept per host
+            host_pool_sizes: per host overrides of pool_maxsize, keyed by host
+                (e.g. "game.virtuals.io") or url prefix (e.g. "https://game.virtuals.io")
+            timeout: default timeout applied to every request that does not set its own
+        """
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.session = requests.Session()
+
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        for host, pool_size in (host_pool_sizes or {}).items():
+            host_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            if "://" in host:
+                self.session.mount(host, host_adapter)
+            else:
+                self.session.mount(f"https://{host}", host_adapter)
+                self.session.mount(f"http://{host}", host_adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request over the pooled connections (same arguments as `requests.request`)
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("get", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("post", url, **kwargs)
+
+    def close(self):
+        """
+        Close all pooled connections
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_default_transport: Optional[HTTPTransport] = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport() -> HTTPTransport:
+    """
+    Get the transport shared by every client that was not given one explicitly
+    """
+    global _default_transport
+    if _default_transport is None:
+        with _default_transport_lock:
+            if _default_transport is None:
+                _default_transport = HTTPTransport()
+    return _default_transport
+
+
+def set_default_transport(transport: HTTPTransport):
+    """
+    Replace the shared default transport (e.g. to change pool sizes or timeouts)
+    """
+    global _default_transport
+    with _default_transport_lock:
+        _default_transport = transport
+
+
+class AsyncHTTPTransport:
+    """
+    asyncio front-end for HTTPTransport.
+
+    Blocking calls are run on a bounded thread pool, so any number of coroutines share
+    `max_workers` threads and the keep-alive connections of the wrapped transport.
+    """
+
+    def __init__(self, transport: Optional[HTTPTransport] = None, max_workers: Optional[int] = None):
+        """
+        Args:
+            transport: pooled transport used to make the requests (defaults to the shared transport)
+            max_workers: maximum number of requests in flight at once (defaults to the pool size
+                of the transport, so every in-flight request can reuse a pooled connection)
+        """
+        self.transport = transport or get_default_transport()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or self.transport.pool_maxsize,
+            thread_name_prefix="virtuals-http",
+        )
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking call (e.g. `utils.post`) without blocking the event loop
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return await self.run(self.transport.request, method, url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> requests.Response:
+        return await self.request("get", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> requests.Response:
+        return await self.request("post", url, **kwargs)
+
+    def close(self):
+        """
+        Stop the thread pool (the wrapped transport is left open as it may be shared)
+        """
+        self._executor.shutdown(wait=False)
+
+
+_default_async_transport: Optional[AsyncHTTPTransport] = None
+
+
+def get_default_async_transport() -> AsyncHTTPTransport:
+    """
+    Get the async transport shared by every async client that was not given one explicitly
+    """
+    global _default_async_transport
+    if _default_async_transport is None:
+        transport = get_default_transport()
+        with _default_transport_lock:
+            if _default_async_transport is None:
+                _default_async_transport = AsyncHTTPTransport(transport)
+    return _default_async_transport
@@ -1,10 +1,11 @@
 from typing import List, Any, Dict, Optional, Union, Set
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from string import Template
 import json
 import uuid
 import requests
 from virtuals_sdk.twitter_agent import sdk
+from virtuals_sdk.transport import HTTPTransport, get_default_transport
 
 
 @dataclass
@@ -48,6 +49,8 @@ class Function:
     config: FunctionConfig
     hint: str = ""
     id: str = None
+    # pooled HTTP transport used to make the request (defaults to the shared transport)
+    transport: Optional[HTTPTransport] = field(default=None, repr=False, compare=False)
 
     def __post_init__(self):
         self.id = self.id or str(uuid.uuid4())
@@ -126,7 +129,8 @@ class Function:
         request_config = self._prepare_request(arg_dict)
 
         # Make the request
-        response = requests.request(**request_config)
+        transport = self.transport or get_default_transport()
+        response = transport.request(**request_config)
 
         # Handle response
         if response.ok:
@@ -162,9 +166,12 @@ class Agent:
         description: str = "",
         world_info: str = "",
         main_heartbeat: int = 15,
-        reaction_heartbeat: int = 5
+        reaction_heartbeat: int = 5,
+        transport: Optional[HTTPTransport] = None,
+        api_url: Optional[str] = None,
     ):
-        self.game_sdk = sdk.GameSDK(api_key)
+        self.transport = transport or get_default_transport()
+        self.game_sdk = sdk.GameSDK(api_key, transport=self.transport, api_url=api_url)
         self.goal = goal
         self.description = description
         self.world_info = world_info
@@ -222,6 +229,10 @@ class Agent:
         Add a custom function to the agent
         Custom functions are automatically added and enabled
         """
+        # Share the agent's pooled transport with the function if it has none of its own
+        if custom_function.transport is None:
+            custom_function.transport = self.transport
+
         # Add to custom functions list
         self.custom_functions.append(custom_function)
 
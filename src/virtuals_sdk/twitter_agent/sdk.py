@@ -1,18 +1,23 @@
-import requests
+from typing import Optional
+from virtuals_sdk.transport import HTTPTransport, get_default_transport
 
 
 class GameSDK:
     api_url: str = "https://game-api.virtuals.io/api"
     api_key: str
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, transport: Optional[HTTPTransport] = None, api_url: Optional[str] = None):
         self.api_key = api_key
+        self.transport = transport or get_default_transport()
+        # API endpoint can be overridden, e.g. to point at a local stand-in server
+        if api_url:
+            self.api_url = api_url
 
     def functions(self):
         """
         Get all default functions
         """
-        response = requests.get(
+        response = self.transport.get(
             f"{self.api_url}/functions", headers={"x-api-key": self.api_key})
 
         if (response.status_code != 200):
@@ -29,7 +34,7 @@ class GameSDK:
         """
         Simulate the agent configuration
         """
-        response = requests.post(
+        response = self.transport.post(
             f"{self.api_url}/simulate",
             json={
                 "data": {
@@ -77,7 +82,7 @@ class GameSDK:
             
         print(payload)
 
-        response = requests.post(
+        response = self.transport.post(
             url,
             json={
                 "data": payload
@@ -94,7 +99,7 @@ class GameSDK:
         """
         Simulate the agent configuration
         """
-        response = requests.post(
+        response = self.transport.post(
             f"{self.api_url}/deploy",
             json={
                 "data": {